@@ -13,36 +13,29 @@ Usage:
 import os
 import sys
 
-# CRITICAL: Set up Python path FIRST, before any other imports
-# This fixes the "No module named 'src'" error on Render
+# api, preprocess_audio and azrt2021 are installed as the voice_model project
+# (pip install -e .), so they import without any sys.path changes
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
-# CRITICAL: Remove parent 'src' directory from Python path to prevent import errors
-# Render deploys to /opt/render/project/src/voice_model/
-# We keep /opt/render/project/src/voice_model/ but remove /opt/render/project/src/
-# This prevents Python from trying to import 'src' as a module
-filtered_path = []
-for p in sys.path:
-    # Keep the current directory (voice_model) even if it contains 'src' in the path
-    if p == current_dir:
-        filtered_path.append(p)
-    # Keep paths that don't contain 'src'
-    elif 'src' not in p:
-        filtered_path.append(p)
-    # Remove paths that end with 'src' (these would cause 'src' module import errors)
-    elif not p.endswith('src') and not p.endswith('src/'):
-        # Only keep if it's related to our current directory
-        if current_dir in p or p in current_dir:
-            filtered_path.append(p)
-sys.path = filtered_path
-
-# Add current directory to Python path (MUST be first)
-if current_dir not in sys.path:
-    sys.path.insert(0, current_dir)
-
+import asyncio
+import hashlib
+import importlib.util
 import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+# Threads per worker process for torch and the BLAS/OpenMP runtimes. The TCN
+# is small enough that intra-op thread dispatch dominates its CPU runtime, so
+# with several worker processes one thread each gives the best throughput;
+# `python api.py` sets INTRA_THREADS=1 for its workers when WORKERS > 1. A
+# single-process server (run.py, plain uvicorn) keeps torch's default unless
+# INTRA_THREADS is set. OMP_NUM_THREADS must be set before numpy/torch are
+# imported to take effect.
+INTRA_THREADS = int(os.environ['INTRA_THREADS']) if os.environ.get('INTRA_THREADS') else None
+if INTRA_THREADS:
+    os.environ.setdefault('OMP_NUM_THREADS', str(INTRA_THREADS))
 
 # Check if running in virtual environment and dependencies are available
 try:
@@ -66,19 +59,18 @@ except ImportError as e:
     print("=" * 60)
     sys.exit(1)
 
+import httpx
 from fastapi import FastAPI, File, UploadFile, HTTPException, Header
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 
-# Add azrt2021 to path for proper module resolution
-# current_dir is already set above and added to sys.path
+# azrt2021 modules import each other by bare name (from tcn import TCN) and
+# saved models pickle the network as tcn.TCN, so azrt2021 itself also has to
+# be importable as a top-level path
 azrt2021_dir = os.path.join(current_dir, 'azrt2021')
 
-# Add azrt2021 directory to path if not already there
-# NOTE: We only add current_dir and azrt2021_dir, NOT parent directories
-# This prevents Python from trying to import 'src' as a module
 if azrt2021_dir not in sys.path and os.path.exists(azrt2021_dir):
     sys.path.insert(0, azrt2021_dir)
 
@@ -100,10 +92,38 @@ except ImportError as e:
 app = FastAPI(
     title="Voice Dementia Detection API",
     description="API for analyzing voice audio files to detect signs of dementia",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-# Enable CORS for all origins
+# Admission control for the analysis endpoints: at most MAX_INFLIGHT requests
+# are processed at once and up to MAX_PENDING are admitted in total (running
+# plus waiting); beyond that requests are rejected with 429 instead of piling
+# up uploads, downloads and threads
+MAX_INFLIGHT = int(os.environ.get('MAX_INFLIGHT', '32'))
+MAX_PENDING = int(os.environ.get('MAX_PENDING', '64'))
+inflight_limit = asyncio.Semaphore(MAX_INFLIGHT)
+pending_limit = asyncio.Semaphore(max(MAX_PENDING, MAX_INFLIGHT))
+
+
+@app.middleware("http")
+async def limit_concurrency(request, call_next):
+    """Bound concurrent /predict and /predict/url requests."""
+    if request.url.path not in ("/predict", "/predict/url"):
+        return await call_next(request)
+    
+    if pending_limit.locked():
+        return ORJSONResponse(
+            status_code=429,
+            content={"detail": "Server overloaded, please retry shortly."}
+        )
+    
+    async with pending_limit:
+        async with inflight_limit:
+            return await call_next(request)
+
+
+# Enable CORS for all origins (registered last so it also wraps 429 responses)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -115,6 +135,73 @@ app.add_middleware(
 # Global model variable (loaded on startup)
 model_obj = None
 
+# Model file picked by load_model's local search, reused on later calls
+resolved_model_path = None
+
+# Global MFCC extractor (created on startup, shared by all requests)
+mfcc_extractor = None
+
+# Micro-batching settings: requests arriving within BATCH_TIMEOUT_MS of each
+# other are coalesced into one forward pass of at most BATCH_MAX_SIZE clips
+B_MAX = int(os.environ.get('BATCH_MAX_SIZE', '8'))
+TAU = float(os.environ.get('BATCH_TIMEOUT_MS', '20')) / 1000
+
+# TCN input length (frames); TCN.reformat pads/truncates every clip to this
+INPUT_LENGTH = 16384
+
+# Preallocated (B_MAX, 13, INPUT_LENGTH) input tensor, reused by every batch
+input_buffer = None
+
+# Formats libsndfile decodes straight from memory; everything else goes
+# through ffmpeg/audioread, which need a file on disk
+IN_MEMORY_EXTENSIONS = {'.wav', '.flac', '.ogg'}
+
+# Temp files for uploaded and downloaded audio go to RAM-backed /dev/shm when
+# available; falls back to the default temp dir elsewhere. Model weights are
+# too large for /dev/shm (64 MB by default in Docker) and always go to disk
+TMP_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# LRU cache of analysis results, keyed by a hash of the audio bytes (and by
+# URL + ETag for /predict/url), so retries and repeated fetches of the same
+# recording skip decoding and inference
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '1024'))
+result_cache = OrderedDict()
+
+# Opt-in torch.compile of the TCN at load time (TORCH_COMPILE=1), with the
+# torch.compile mode to use (e.g. max-autotune for longer tuning on GPU)
+TORCH_COMPILE = os.environ.get('TORCH_COMPILE', '0') == '1'
+TORCH_COMPILE_MODE = os.environ.get('TORCH_COMPILE_MODE', 'reduce-overhead')
+
+# Opt-in ahead-of-time compilation (AOT_COMPILE=1): the TCN is exported with
+# torch.export for the fixed 16384-frame input and compiled by AOTInductor into
+# a package saved next to the checkpoint, which later startups load directly.
+# Packages for MODEL_URL downloads go in AOT_CACHE_DIR, keyed by the weights' hash
+AOT_COMPILE = os.environ.get('AOT_COMPILE', '0') == '1'
+AOT_CACHE_DIR = os.environ.get('AOT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'voice_models'))
+
+# Opt-in int8 quantization for CPU inference: none, dynamic or static.
+# Static quantization is calibrated on MFCC .npy files from
+# QUANTIZE_CALIBRATION_DIR
+QUANTIZE = os.environ.get('QUANTIZE', 'none').lower()
+QUANTIZE_CALIBRATION_DIR = os.environ.get('QUANTIZE_CALIBRATION_DIR')
+
+# Opt-in mixed precision for the forward pass: none, bf16 or fp16
+AUTOCAST = os.environ.get('AUTOCAST', 'none').lower()
+AUTOCAST_DTYPE = {'bf16': torch.bfloat16, 'fp16': torch.float16}.get(AUTOCAST)
+
+# uvicorn server options for `python api.py` and run.py: the C event loop and
+# HTTP parser from uvicorn[standard] when installed (asyncio/h11 otherwise),
+# and no per-request access log unless ACCESS_LOG=1
+ACCESS_LOG = os.environ.get('ACCESS_LOG', '0') == '1'
+SERVER_OPTIONS = {
+    'loop': 'uvloop' if importlib.util.find_spec('uvloop') else 'asyncio',
+    'http': 'httptools' if importlib.util.find_spec('httptools') else 'h11',
+    'access_log': ACCESS_LOG,
+}
+
+# Parallel HTTP range requests used to download MODEL_URL weights
+MODEL_DOWNLOAD_CONNECTIONS = int(os.environ.get('MODEL_DOWNLOAD_CONNECTIONS', '8'))
+
 # Device detection - default to CPU for stability, allow override via environment variable
 if os.environ.get('DEVICE'):
     device = os.environ.get('DEVICE')
@@ -124,6 +211,20 @@ else:
     device = 'cpu'
     print(f"📱 Using CPU (set DEVICE=cuda:0 environment variable to use GPU)")
 
+if INTRA_THREADS:
+    torch.set_num_threads(INTRA_THREADS)
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    # Already fixed if torch ran parallel work before this module was imported
+    pass
+
+# Every input has the same (batch, 13, 16384) shape, so let cuDNN benchmark
+# its convolution algorithms once (including tensor-core/NHWC kernels) and
+# reuse the fastest
+if device.startswith('cuda'):
+    torch.backends.cudnn.benchmark = True
+
 
 # Pydantic models for request bodies
 class URLRequest(BaseModel):
@@ -144,7 +245,7 @@ def load_model(model_path: Optional[str] = None):
     model_path : str, optional
         Path to model file or URL. If None, checks MODEL_URL env var or local files.
     """
-    global model_obj, device
+    global model_obj, device, resolved_model_path
     
     # Check for MODEL_URL environment variable (for external storage like Supabase)
     model_url = os.environ.get('MODEL_URL')
@@ -154,19 +255,19 @@ def load_model(model_path: Optional[str] = None):
         print(f"📥 Model URL found in environment: {model_url}")
         model_path = model_url
     
-    # If model_path is a URL, download it first
+    # If model_path is a URL, download it first (to disk; removed once loaded)
+    downloaded_path = None
     if model_path and (model_path.startswith('http://') or model_path.startswith('https://')):
         print(f"📥 Downloading model from URL: {model_path}")
-        import urllib.request
-        import tempfile
         
         # Create temp file for downloaded model
         with tempfile.NamedTemporaryFile(delete=False, suffix='.pt') as tmp:
             try:
                 # Download with progress indication
                 print("   Downloading... (this may take a minute for large models)")
-                urllib.request.urlretrieve(model_path, tmp.name)
-                model_path = tmp.name
+                tmp.close()
+                download_file(model_path, tmp.name)
+                model_path = downloaded_path = tmp.name
                 file_size = os.path.getsize(model_path) / (1024 * 1024)  # Size in MB
                 print(f"✅ Model downloaded successfully ({file_size:.2f} MB)")
             except Exception as e:
@@ -176,16 +277,17 @@ def load_model(model_path: Optional[str] = None):
     # Find model file if not provided
     if model_path is None or (not model_path.startswith('http') and not os.path.isfile(model_path)):
         pt_files_dir = Path(__file__).parent / 'azrt2021' / 'pt_files'
-        if pt_files_dir.exists():
-            pt_files = []
-            for root, dirs, files in os.walk(pt_files_dir):
-                for file in files:
-                    if file.endswith('.pt') and 'tmp' not in file:
-                        pt_files.append(os.path.join(root, file))
+        if resolved_model_path and os.path.isfile(resolved_model_path):
+            model_path = resolved_model_path
+            print(f"📁 Using local model: {model_path}")
+        elif pt_files_dir.exists():
+            # Most recently modified checkpoint, found in one pass (no full sort)
+            latest = max((p for p in pt_files_dir.rglob('*.pt') if 'tmp' not in p.name),
+                         key=lambda p: p.stat().st_mtime, default=None)
             
-            if pt_files:
-                pt_files.sort(key=os.path.getmtime, reverse=True)
-                model_path = pt_files[0]
+            if latest is not None:
+                model_path = str(latest)
+                resolved_model_path = model_path
                 print(f"📁 Using most recent local model: {model_path}")
             else:
                 raise FileNotFoundError(
@@ -204,48 +306,345 @@ def load_model(model_path: Optional[str] = None):
     if not model_path.startswith('http') and not os.path.isfile(model_path):
         raise FileNotFoundError(f"Model file not found: {model_path}")
     
-    print(f"🔄 Loading model from: {model_path}")
+    try:
+        print(f"🔄 Loading model from: {model_path}")
+        
+        # Initialize model
+        n_concat = 10
+        neural_network = TCN(device)
+        model_obj = Model(n_concat=n_concat, device=device, nn=neural_network)
+        model_obj.load_model(model_path)
+        
+        # CRITICAL: Explicitly move model to the correct device
+        # This ensures models saved on GPU are properly moved to CPU
+        model_obj.to(device)
+        
+        # Inference only: disable gradients once instead of per request
+        model_obj.nn.requires_grad_(False)
+        model_obj.nn.eval()
+        
+        if QUANTIZE != 'none' and device == 'cpu':
+            quantize_model(QUANTIZE)
+        
+        if AOT_COMPILE:
+            aot_compile_model(model_path, cache_by_hash=downloaded_path is not None)
+        elif TORCH_COMPILE:
+            compile_model()
+        
+        print(f"✅ Model loaded successfully on device: {device}")
+    finally:
+        # The weights are in memory now; don't leave the download on disk
+        if downloaded_path is not None:
+            os.unlink(downloaded_path)
+
+
+class _RangeUnsupported(Exception):
+    """Raised by download_file when a range request gets the whole file back."""
+
+
+def download_file(url: str, path: str):
+    """
+    Download url to path, using parallel HTTP range requests when possible.
     
-    # Initialize model
-    n_concat = 10
-    neural_network = TCN(device)
-    model_obj = Model(n_concat=n_concat, device=device, nn=neural_network)
-    model_obj.load_model(model_path)
+    The file is split into MODEL_DOWNLOAD_CONNECTIONS byte ranges fetched
+    concurrently and written at their offsets. Falls back to a single stream
+    when the server doesn't advertise range support, the size is unknown or
+    a range request is answered with the whole file.
+    """
+    with httpx.Client(follow_redirects=True, timeout=60) as client:
+        
+        def download_single():
+            with client.stream("GET", url) as response:
+                response.raise_for_status()
+                with open(path, 'wb') as f:
+                    for chunk in response.iter_bytes(1 << 20):
+                        f.write(chunk)
+        
+        head = client.head(url)
+        size = int(head.headers.get('Content-Length', 0)) if head.is_success else 0
+        ranges_ok = head.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        n_conn = min(MODEL_DOWNLOAD_CONNECTIONS, size // (1 << 20))
+        
+        if not (ranges_ok and n_conn > 1 and hasattr(os, 'pwrite')):
+            download_single()
+            return
+        
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        try:
+            os.ftruncate(fd, size)
+            
+            def fetch(start, end):
+                headers = {'Range': f'bytes={start}-{end}'}
+                with client.stream("GET", url, headers=headers) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise _RangeUnsupported("server ignored the Range header")
+                    offset = start
+                    for chunk in response.iter_bytes(1 << 20):
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                if offset != end + 1:
+                    raise RuntimeError(f"incomplete range {start}-{end}")
+            
+            step = -(-size // n_conn)
+            with ThreadPoolExecutor(max_workers=n_conn) as pool:
+                futures = [pool.submit(fetch, start, min(start + step, size) - 1)
+                           for start in range(0, size, step)]
+                for future in futures:
+                    future.result()
+        except _RangeUnsupported:
+            os.close(fd)
+            fd = None
+            download_single()
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+
+def quantize_model(mode: str):
+    """
+    Quantize the loaded TCN to int8 for CPU inference.
     
-    # CRITICAL: Explicitly move model to the correct device
-    # This ensures models saved on GPU are properly moved to CPU
-    model_obj.to(device)
-    model_obj.nn.eval()
+    Parameters:
+    -----------
+    mode : str
+        'dynamic' quantizes the linear classifier weights only (PyTorch has no
+        dynamic Conv1d); 'static' quantizes the whole convolution stack using
+        activation ranges observed on the calibration set
+    """
+    global model_obj
     
-    # Ensure all parameters are on the correct device and disable gradients
-    for param in model_obj.nn.parameters():
-        param.requires_grad = False
+    if mode == 'dynamic':
+        model_obj.nn = torch.ao.quantization.quantize_dynamic(
+            model_obj.nn, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        print("✅ Model quantized (dynamic int8)")
+    elif mode == 'static':
+        calibration_files = []
+        if QUANTIZE_CALIBRATION_DIR:
+            calibration_files = sorted(Path(QUANTIZE_CALIBRATION_DIR).rglob('*.npy'))[:32]
+        if not calibration_files:
+            print("⚠️  Warning: QUANTIZE=static needs MFCC .npy files in "
+                  "QUANTIZE_CALIBRATION_DIR; keeping the float32 model")
+            return
+        
+        tcn = torch.nn.Sequential(
+            torch.ao.quantization.QuantStub(),
+            model_obj.nn.tcn,
+            torch.ao.quantization.DeQuantStub()
+        )
+        tcn.qconfig = torch.ao.quantization.get_default_qconfig('fbgemm')
+        torch.ao.quantization.prepare(tcn, inplace=True)
+        model_obj.nn.tcn = tcn
+        
+        # Observe activation ranges on real features
+        with torch.inference_mode():
+            for npy_file in calibration_files:
+                mfcc_input = model_obj.nn.reformat([np.load(npy_file).astype(np.float32, copy=False)], 10)
+                model_obj.nn.get_scores(mfcc_input)
+        
+        torch.ao.quantization.convert(tcn, inplace=True)
+        print(f"✅ Model quantized (static int8, calibrated on {len(calibration_files)} files)")
+    else:
+        print(f"⚠️  Warning: Unknown QUANTIZE mode '{mode}'; keeping the float32 model")
+
+
+def compile_model():
+    """
+    Compile the TCN's convolution stack with torch.compile.
+    
+    reformat() pads every input to 16384 frames, so the network compiles to
+    a single graph (fullgraph) that lets conv + ELU chains be fused; only
+    the batch dimension varies between calls. A warmup forward pass triggers compilation here rather
+    than on the first request; if it fails the model stays in eager mode.
+    """
+    eager_tcn = model_obj.nn.tcn
+    try:
+        print("🔧 Compiling model with torch.compile...")
+        model_obj.nn.tcn = torch.compile(eager_tcn, mode=TORCH_COMPILE_MODE, fullgraph=True)
+        example = torch.zeros(1, 13, 16384, device=device)
+        with torch.inference_mode():
+            model_obj.nn.get_scores([example])
+        print("✅ Model compiled")
+    except Exception as e:
+        model_obj.nn.tcn = eager_tcn
+        print(f"⚠️  Warning: torch.compile failed, using eager mode: {e}")
+
+
+class AOTModule(torch.nn.Module):
+    """Module wrapper so an AOTInductor runner can replace TCN.tcn."""
+    
+    def __init__(self, runner):
+        super().__init__()
+        self.runner = runner
     
-    print(f"✅ Model loaded successfully on device: {device}")
+    def forward(self, X):
+        return self.runner(X)
 
 
-def predict_voice_from_audio(audio_path: str) -> dict:
+def aot_compile_model(model_path: str, cache_by_hash: bool = False):
     """
-    Predict dementia probability from an audio file.
+    Replace the TCN's convolution stack with an AOTInductor-compiled version.
+    
+    The stack is exported for a fixed (batch, 13, 16384) input with only the
+    batch dimension left dynamic, so the compiled kernels hardcode every
+    other shape and stride. The package is cached as <model_path>.pt2 and
+    rebuilt when the checkpoint is newer. With cache_by_hash (temporary
+    downloads) it is cached in AOT_CACHE_DIR under the SHA-256 of the
+    checkpoint instead. On any failure the model stays in eager mode.
+    """
+    import torch._inductor
+    
+    eager_tcn = model_obj.nn.tcn
+    try:
+        if cache_by_hash:
+            digest = hashlib.sha256()
+            with open(model_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+            os.makedirs(AOT_CACHE_DIR, exist_ok=True)
+            package_path = os.path.join(AOT_CACHE_DIR, digest.hexdigest() + '.pt2')
+            up_to_date = os.path.isfile(package_path)
+        else:
+            package_path = model_path + '.pt2'
+            up_to_date = (os.path.isfile(package_path)
+                          and os.path.getmtime(package_path) >= os.path.getmtime(model_path))
+        if not up_to_date:
+            print("🔧 Compiling model with AOTInductor (one-off, may take a few minutes)...")
+            example = torch.zeros(2, 13, INPUT_LENGTH, device=device)
+            batch = torch.export.Dim('batch', min=1, max=1024)
+            exported = torch.export.export(eager_tcn, (example,), dynamic_shapes=({0: batch},))
+            torch._inductor.aoti_compile_and_package(exported, package_path=package_path)
+        model_obj.nn.tcn = AOTModule(torch._inductor.aoti_load_package(package_path))
+        print(f"✅ Loaded AOT-compiled model: {package_path}")
+    except Exception as e:
+        model_obj.nn.tcn = eager_tcn
+        print(f"⚠️  Warning: AOT compilation failed, using eager mode: {e}")
+
+
+def predict_batch(mfcc_batch: List[np.ndarray]) -> List[Tuple[float, float]]:
+    """
+    Run a single forward pass over a batch of MFCC feature arrays.
     
     Parameters:
     -----------
-    audio_path : str
-        Path to audio file
+    mfcc_batch : list of numpy.ndarray
+        MFCC features, one (num_windows, 13) array per audio clip
     
     Returns:
     --------
-    dict: Analysis results with probabilities and interpretation
+    list of (dementia_prob, normal_prob) tuples, in input order
     """
-    if model_obj is None:
-        raise HTTPException(status_code=503, detail="Model not loaded. Please ensure a model is available.")
+    global input_buffer
     
-    try:
-        # Load audio
-        audio = load_audio_file(audio_path)
-        audio_length_seconds = len(audio) / 16000
-        
-        # Extract MFCC features
+    if input_buffer is None:
+        input_buffer = torch.empty(B_MAX, 13, INPUT_LENGTH, device=device)
+    
+    # The extractor always returns (n_frames, 13): transpose unconditionally
+    # to (13, n_frames) rather than guessing the layout from the shape, which
+    # is ambiguous for a clip with exactly 13 frames
+    features = [torch.as_tensor(mfcc, dtype=torch.float32).T for mfcc in mfcc_batch]
+    
+    if len(features) > input_buffer.shape[0]:
+        # Bigger than the buffer (not produced by the batcher): let the model
+        # allocate its own inputs
+        mfcc_input = model_obj.nn.reformat(features, 10)
+    else:
+        # Copy each clip into its slot and zero the tail, matching the
+        # padding/truncation done by TCN.reformat without allocating
+        for idx, x in enumerate(features):
+            length = min(x.shape[1], INPUT_LENGTH)
+            input_buffer[idx, :, :length].copy_(x[:, :length])
+            input_buffer[idx, :, length:].zero_()
+        mfcc_input = input_buffer[:len(features)]
+    
+    device_type = 'cuda' if str(device).startswith('cuda') else 'cpu'
+    with torch.inference_mode(), torch.autocast(device_type, dtype=AUTOCAST_DTYPE,
+                                                enabled=AUTOCAST_DTYPE is not None):
+        scores = model_obj.nn.get_scores(mfcc_input).float()
+        # Two-class softmax: p0 = sigmoid(s0 - s1), p1 = 1 - p0
+        dementia = torch.sigmoid(scores[:, 0] - scores[:, 1]).tolist()
+    
+    # NOTE: Labels are flipped (class 0 = Dementia, class 1 = Normal)
+    return [(p, 1.0 - p) for p in dementia]
+
+
+class InferenceBatcher:
+    """
+    Coalesce concurrent prediction requests into batched forward passes.
+    
+    Requests are queued by submit(); a single background task (batcher_loop)
+    collects up to max_batch_size items, waiting at most timeout seconds after
+    the first one arrives, and runs them through predict_batch() at once.
+    """
+    
+    def __init__(self, max_batch_size: int = B_MAX, timeout: float = TAU):
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self.queue = None
+        self._task = None
+    
+    def start(self):
+        """Start the background batching task on the running event loop."""
+        if self._task is None or self._task.done():
+            self.queue = asyncio.Queue()
+            self._task = asyncio.create_task(self.batcher_loop())
+    
+    async def stop(self):
+        """Cancel the background batching task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def submit(self, mfcc_features: np.ndarray) -> Tuple[float, float]:
+        """Queue MFCC features and wait for their (dementia_prob, normal_prob)."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((mfcc_features, future))
+        return await future
+    
+    async def batcher_loop(self):
+        """Collect queued requests into batches and resolve their futures."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.timeout
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            features = [mfcc for mfcc, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                # Run the forward pass off the event loop so new requests keep queueing
+                results = await asyncio.to_thread(predict_batch, features)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future, result in zip(futures, results):
+                    if not future.done():
+                        future.set_result(result)
+
+
+batcher = InferenceBatcher()
+
+
+def get_mfcc_extractor() -> MFCC_Extractor:
+    """Return the shared MFCC extractor, creating it on first use."""
+    global mfcc_extractor
+    
+    if mfcc_extractor is None:
         mfcc_extractor = MFCC_Extractor(
             samplerate=16000,
             winlen=0.025,
@@ -254,31 +653,75 @@ def predict_voice_from_audio(audio_path: str) -> dict:
             nfilt=26,
             device=device
         )
+    return mfcc_extractor
+
+
+def extract_features(audio_path: Union[str, BinaryIO]) -> Tuple[np.ndarray, float]:
+    """
+    Load an audio file and extract its MFCC features.
+    
+    Parameters:
+    -----------
+    audio_path : str or file-like
+        Path to audio file, or an in-memory buffer of its contents
+    
+    Returns:
+    --------
+    (mfcc_features, audio_length_seconds)
+    """
+    # Load audio
+    audio = load_audio_file(audio_path)
+    audio_length_seconds = len(audio) / 16000
+    
+    # Extract MFCC features (the extractor holds no per-call state, so one
+    # instance is safely shared across concurrent requests)
+    audio_batch = audio.reshape(1, -1)
+    mfcc_features = get_mfcc_extractor()(audio_batch)[0]
+    
+    return mfcc_features, audio_length_seconds
+
+
+def cache_get(key) -> Optional[dict]:
+    """Return the cached result for key (marking it recently used), or None."""
+    result = result_cache.get(key)
+    if result is not None:
+        result_cache.move_to_end(key)
+    return result
+
+
+def cache_put(key, result: dict):
+    """Store a result, evicting the least recently used entry when full."""
+    if RESULT_CACHE_SIZE <= 0:
+        return
+    result_cache[key] = result
+    result_cache.move_to_end(key)
+    while len(result_cache) > RESULT_CACHE_SIZE:
+        result_cache.popitem(last=False)
+
+
+async def predict_voice_from_audio(audio_path: Union[str, BinaryIO]) -> dict:
+    """
+    Predict dementia probability from an audio file.
+    
+    Parameters:
+    -----------
+    audio_path : str or file-like
+        Path to audio file, or an in-memory buffer of its contents
+    
+    Returns:
+    --------
+    dict: Analysis results with probabilities and interpretation
+    """
+    if model_obj is None:
+        raise HTTPException(status_code=503, detail="Model not loaded. Please ensure a model is available.")
+    
+    try:
+        # Decode and extract features in a worker thread so other requests
+        # (e.g. in-flight downloads) keep making progress
+        mfcc_features, audio_length_seconds = await asyncio.to_thread(extract_features, audio_path)
         
-        audio_batch = audio.reshape(1, -1)
-        mfcc_features = mfcc_extractor(audio_batch)[0]
-        
-        # Ensure MFCC features are numpy array (CPU) or convert if needed
-        if isinstance(mfcc_features, torch.Tensor):
-            # Convert tensor to numpy if on wrong device
-            if mfcc_features.device.type != 'cpu':
-                mfcc_features = mfcc_features.cpu().numpy()
-            else:
-                mfcc_features = mfcc_features.numpy()
-        elif not isinstance(mfcc_features, np.ndarray):
-            mfcc_features = np.array(mfcc_features)
-        
-        # Prepare data for model
-        mfcc_list = [mfcc_features]
-        model_obj.nn.reformat(mfcc_list, 10)
-        
-        # Get prediction
-        with torch.no_grad():
-            scores = model_obj.nn.get_scores(mfcc_list)
-            probs = torch.softmax(scores, dim=1)
-            # NOTE: Labels are flipped (class 0 = Dementia, class 1 = Normal)
-            dementia_prob = probs[0][0].item()
-            normal_prob = probs[0][1].item()
+        # Get prediction (batched with other in-flight requests)
+        dementia_prob, normal_prob = await batcher.submit(mfcc_features)
         
         # Determine result
         if dementia_prob > 0.5:
@@ -316,10 +759,40 @@ def predict_voice_from_audio(audio_path: str) -> dict:
 async def startup_event():
     """Load model on startup."""
     try:
-        load_model()
+        await asyncio.to_thread(load_model)
     except Exception as e:
         print(f"⚠️  Warning: Could not load model on startup: {e}")
         print("   Model will be loaded on first request.")
+    
+    # Build the shared MFCC extractor (filter bank, DCT matrix) once and run it
+    # so its numba kernel (if enabled) is compiled before the first request
+    await asyncio.to_thread(get_mfcc_extractor(), np.zeros((1, 16000), dtype=np.float32))
+    
+    # Warm up the inference path (kernel selection, allocator, input buffer)
+    # so the first real request runs at steady-state latency; with
+    # TORCH_COMPILE, compile_model() has already run the compiling forward
+    # pass, so one pass here is enough either way
+    if model_obj is not None:
+        silence = np.zeros((400, 13), dtype=np.float32)
+        await asyncio.to_thread(predict_batch, [silence])
+    
+    # Shared HTTP client for /predict/url: keeps connections (and TLS
+    # sessions) to storage hosts alive across requests
+    app.state.http = httpx.AsyncClient(
+        timeout=30,
+        follow_redirects=True,
+        http2=True,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=16)
+    )
+    
+    batcher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the inference batcher and close the HTTP client."""
+    await batcher.stop()
+    await app.state.http.aclose()
 
 
 @app.get("/")
@@ -383,25 +856,46 @@ async def predict(
     # Load model if not already loaded
     if model_obj is None:
         try:
-            load_model()
+            await asyncio.to_thread(load_model)
         except Exception as e:
             raise HTTPException(
                 status_code=503,
                 detail=f"Model not available: {str(e)}"
             )
     
+    # Decode directly from the upload's spooled buffer when the codec allows
+    # it, without copying the whole upload into a bytes object first
+    if file_extension in IN_MEMORY_EXTENSIONS:
+        digest = hashlib.blake2b(digest_size=16)
+        while chunk := await file.read(1 << 20):
+            digest.update(chunk)
+        key = digest.hexdigest()
+        result = cache_get(key)
+        if result is None:
+            await file.seek(0)
+            result = await predict_voice_from_audio(file.file)
+            cache_put(key, result)
+        return ORJSONResponse(content=result)
+    
     # Save uploaded file to temporary location
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension, dir=TMP_DIR) as tmp_file:
         try:
-            # Write uploaded file to temp file
-            content = await file.read()
-            tmp_file.write(content)
+            # Stream the upload to the temp file in 1 MB chunks, hashing as we go
+            digest = hashlib.blake2b(digest_size=16)
+            while chunk := await file.read(1 << 20):
+                digest.update(chunk)
+                tmp_file.write(chunk)
+            tmp_file.close()
             tmp_file_path = tmp_file.name
             
-            # Analyze the audio
-            result = predict_voice_from_audio(tmp_file_path)
+            key = digest.hexdigest()
+            result = cache_get(key)
+            if result is None:
+                # Analyze the audio
+                result = await predict_voice_from_audio(tmp_file_path)
+                cache_put(key, result)
             
-            return JSONResponse(content=result)
+            return ORJSONResponse(content=result)
         
         except HTTPException:
             raise
@@ -444,65 +938,72 @@ async def predict_from_url(
     - Any public URL: https://example.com/audio.mp3
     """
     url = request.url
-    import urllib.request
-    import urllib.parse
     
     # Load model if not already loaded
     if model_obj is None:
         try:
-            load_model()
+            await asyncio.to_thread(load_model)
         except Exception as e:
             raise HTTPException(
                 status_code=503,
                 detail=f"Model not available: {str(e)}"
             )
     
+    # Add user agent to avoid blocking
+    headers = {"User-Agent": "Voice-Dementia-Detection-API/1.0"}
+    
+    # Add authorization header if provided (for Supabase authenticated URLs)
+    if authorization:
+        if authorization.startswith("Bearer "):
+            headers["Authorization"] = authorization
+        else:
+            headers["Authorization"] = f"Bearer {authorization}"
+    
     # Download file from URL
-    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(url).suffix) as tmp_file:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(url).suffix, dir=TMP_DIR) as tmp_file:
         tmp_file_path = tmp_file.name
         try:
-            # Create request with optional authorization header
-            req = urllib.request.Request(url)
-            
-            # Add authorization header if provided (for Supabase authenticated URLs)
-            if authorization:
-                if authorization.startswith("Bearer "):
-                    req.add_header("Authorization", authorization)
-                else:
-                    req.add_header("Authorization", f"Bearer {authorization}")
-            
-            # Add user agent to avoid blocking
-            req.add_header("User-Agent", "Voice-Dementia-Detection-API/1.0")
-            
-            # Download the file
-            with urllib.request.urlopen(req, timeout=30) as response:
-                # Check content type if available
-                content_type = response.headers.get("Content-Type", "")
-                if content_type and not any(ext in content_type.lower() for ext in ['audio', 'octet-stream', 'binary']):
-                    # Not a critical check, but log if unexpected
-                    pass
+            # Stream the download to the temp file without blocking the event loop
+            async with app.state.http.stream("GET", url, headers=headers) as response:
+                response.raise_for_status()
+                
+                # Same object as a previous request: skip the body entirely
+                etag = response.headers.get("ETag")
+                url_key = (url, etag) if etag else None
+                result = cache_get(url_key) if url_key else None
+                if result is not None:
+                    return ORJSONResponse(content=result)
                 
-                # Write to temp file
-                with open(tmp_file_path, 'wb') as f:
-                    f.write(response.read())
+                digest = hashlib.blake2b(digest_size=16)
+                async for chunk in response.aiter_bytes(64 * 1024):
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+            tmp_file.close()
             
-            # Analyze the audio
-            result = predict_voice_from_audio(tmp_file_path)
+            key = digest.hexdigest()
+            result = cache_get(key)
+            if result is None:
+                # Analyze the audio
+                result = await predict_voice_from_audio(tmp_file_path)
+                cache_put(key, result)
+            if url_key:
+                cache_put(url_key, result)
             
-            return JSONResponse(content=result)
+            return ORJSONResponse(content=result)
         
-        except urllib.error.HTTPError as e:
-            if e.code == 401:
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status == 401:
                 raise HTTPException(
                     status_code=401,
                     detail="Unauthorized: Invalid or missing authentication token. For Supabase, provide a valid Bearer token."
                 )
-            elif e.code == 403:
+            elif status == 403:
                 raise HTTPException(
                     status_code=403,
                     detail="Forbidden: Access denied. Check if the file is public or use a signed URL with proper authentication."
                 )
-            elif e.code == 404:
+            elif status == 404:
                 raise HTTPException(
                     status_code=404,
                     detail="File not found at the provided URL."
@@ -510,9 +1011,9 @@ async def predict_from_url(
             else:
                 raise HTTPException(
                     status_code=500,
-                    detail=f"Error downloading file: HTTP {e.code} - {e.reason}"
+                    detail=f"Error downloading file: HTTP {status} - {e.response.reason_phrase}"
                 )
-        except urllib.error.URLError as e:
+        except httpx.RequestError as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"Error accessing URL: {str(e)}. Check if the URL is valid and accessible."
@@ -532,11 +1033,18 @@ if __name__ == "__main__":
     # Run the API server
     # Use PORT environment variable if available (for Render, Heroku, etc.)
     port = int(os.environ.get("PORT", 8000))
+    # One process per pair of cores by default; each uses INTRA_THREADS threads
+    workers = int(os.environ.get("WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+    if workers > 1:
+        # Worker processes import this module afresh and inherit the setting
+        os.environ.setdefault('INTRA_THREADS', '1')
     uvicorn.run(
         "api:app",
         host="0.0.0.0",
         port=port,
+        workers=workers,
         reload=False,  # Disable reload in production
-        log_level="info"
+        log_level="info",
+        **SERVER_OPTIONS
     )
 
@@ -20,50 +20,87 @@ Example:
 import sys
 import os
 import argparse
+import hashlib
+import io
+import json
+import re
+import logging
+import logging.handlers
 import pandas as pd
 from pathlib import Path
-import numpy as np
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
-# Import the preprocessing function
-# Add current directory to path to import preprocess_audio
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Shared preprocessing (installed with the project: pip install -e .)
 try:
-    from preprocess_audio import audio_to_mfcc, load_audio_file
-except ImportError:
-    # If import fails, define the functions inline
-    import numpy as np
-    try:
-        import librosa
-        HAS_LIBROSA = True
-    except ImportError:
-        HAS_LIBROSA = False
-    
-    from azrt2021.mfcc import MFCC_Extractor
-    
-    def load_audio_file(audio_path, sr=16000):
-        """Load audio file."""
-        if not os.path.isfile(audio_path):
-            raise FileNotFoundError(f"Audio file not found: {audio_path}")
-        if HAS_LIBROSA:
-            audio, _ = librosa.load(audio_path, sr=sr, mono=True)
-            return audio
-        raise RuntimeError("librosa required. Install: pip install librosa")
-    
-    def audio_to_mfcc(audio_path, output_path, device='cpu', **mfcc_kwargs):
-        """Convert audio to MFCC."""
-        audio = load_audio_file(audio_path)
-        mfcc_extractor = MFCC_Extractor(
-            samplerate=16000, winlen=0.025, winstep=0.01, numcep=13,
-            nfilt=26, device=device, **mfcc_kwargs
-        )
-        audio_batch = audio.reshape(1, -1)
-        mfcc_features = mfcc_extractor(audio_batch)[0]
-        os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else '.', exist_ok=True)
-        np.save(output_path, mfcc_features)
+    from preprocess_audio import audio_to_mfcc_batch, get_mfcc_extractor
+except ImportError as e:
+    raise ImportError(
+        f"Could not import preprocess_audio ({e}). Run this script from the voice_model "
+        f"directory or install the project with: pip install -e ."
+    ) from e
+
+# Per-file progress goes through this logger (see setup_logging)
+logger = logging.getLogger('auto_convert_audio')
 
 # Audio file extensions to process
 AUDIO_EXTENSIONS = ['.mp3', '.wav', '.flac', '.m4a', '.ogg', '.aac']
+AUDIO_EXTENSION_SET = frozenset(AUDIO_EXTENSIONS)
+
+# First run of digits in a person name, used as the CSV id
+DIGIT_RE = re.compile(r'\d+')
+
+
+class PersonFiles():
+    """
+    A person's audio files and the matching MFCC files (None where the
+    conversion failed), kept as two parallel lists.
+    """
+    __slots__ = ('audio', 'mfcc')
+    
+    def __init__(self, audio=None, mfcc=None):
+        self.audio = [] if audio is None else audio
+        self.mfcc = [] if mfcc is None else mfcc
+    
+    def append(self, audio_file, mfcc_file):
+        self.audio.append(audio_file)
+        self.mfcc.append(mfcc_file)
+    
+    def __len__(self):
+        return len(self.mfcc)
+
+
+def scan_audio_files(root):
+    """Yield the paths of all audio files under root in one os.scandir pass."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSION_SET and entry.is_file():
+                    yield entry.path
+
+
+def setup_logging(verbose=False):
+    """
+    Send per-file log records to stderr.
+    
+    Progress lines are logged at DEBUG and only shown when verbose; errors
+    are always shown. Records are written in blocks of 100 (errors flush
+    immediately).
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    handler = logging.handlers.MemoryHandler(100, flushLevel=logging.ERROR, target=handler)
+    logger.handlers[:] = [handler]
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    logger.propagate = False
+
+
+def _init_worker(device):
+    """Process pool initializer: build the MFCC extractor once."""
+    get_mfcc_extractor(device)
 
 
 def find_audio_files_by_person(directory):
@@ -71,7 +108,7 @@ def find_audio_files_by_person(directory):
     Find all audio files grouped by person (folder name).
     
     Returns:
-        dict: {person_name: [list of audio file paths]}
+        dict: {person_name: [sorted list of audio file path strings]}
     """
     directory = Path(directory)
     
@@ -81,22 +118,24 @@ def find_audio_files_by_person(directory):
     # Dictionary to group files by person (folder name)
     person_files = defaultdict(list)
     
-    # Find all audio files
-    for ext in AUDIO_EXTENSIONS:
-        for audio_file in directory.rglob(f'*{ext}'):
-            # Get the parent directory name (person name)
-            person_name = audio_file.parent.name
-            
-            # Skip if parent is the root data directory itself
-            if person_name == directory.name or person_name == 'data':
-                # Try to get the next level up
-                if audio_file.parent.parent != directory:
-                    person_name = audio_file.parent.parent.name
-                else:
-                    # If file is directly in data/, use filename as person name
-                    person_name = audio_file.stem.split('_')[0]
-            
-            person_files[person_name].append(audio_file)
+    # Find all audio files (single traversal for all extensions)
+    root = str(directory)
+    for audio_file in scan_audio_files(root):
+        # Get the parent directory name (person name)
+        parent = os.path.dirname(audio_file)
+        person_name = os.path.basename(parent)
+        
+        # Skip if parent is the root data directory itself
+        if person_name == directory.name or person_name == 'data':
+            # Try to get the next level up
+            grandparent = os.path.dirname(parent)
+            if os.path.normpath(grandparent) != os.path.normpath(root):
+                person_name = os.path.basename(grandparent)
+            else:
+                # If file is directly in data/, use filename as person name
+                person_name = os.path.splitext(os.path.basename(audio_file))[0].split('_')[0]
+        
+        person_files[person_name].append(audio_file)
     
     # Sort files within each person
     for person in person_files:
@@ -105,29 +144,39 @@ def find_audio_files_by_person(directory):
     return dict(person_files)
 
 
-def convert_audio_to_mfcc(audio_path, output_path, device='cpu', overwrite=False):
+def synthetic_person_id(person_name, used_ids):
     """
-    Convert a single audio file to MFCC .npy file.
+    Four-digit ID for a person whose name has no digits.
     
-    Returns:
-        Path to the created .npy file, or None if failed
+    Derived from a blake2b digest of the name, so a person keeps the same ID
+    across runs and as other persons are added; on a clash with an ID in
+    used_ids the next free number is taken (persons are visited in sorted
+    order, so this is deterministic too). The result is added to used_ids.
     """
-    audio_path = Path(audio_path)
-    output_path = Path(output_path)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    
-    # Skip if already exists and not overwriting
-    if output_path.exists() and not overwrite:
-        print(f"⏭️  Skipping {audio_path.name} (already exists: {output_path.name})")
-        return str(output_path)
+    num = int.from_bytes(hashlib.blake2b(person_name.encode('utf-8'), digest_size=4).digest(), 'big') % 10000
+    while f"{num:04d}" in used_ids and len(used_ids) < 10000:
+        num = (num + 1) % 10000
+    used_ids.add(f"{num:04d}")
+    return f"{num:04d}"
+
+
+def relpath_or_abs(path, start, cwd):
+    """
+    os.path.relpath(path, start), or path unchanged when it has no relative
+    form (e.g. another drive).
     
+    Relative paths are resolved against cwd, looked up once by the caller,
+    instead of by relpath on every call; paths under start (which must be
+    absolute and normalized) just have the prefix stripped.
+    """
+    abs_path = os.path.normpath(os.path.join(cwd, path))
+    prefix = os.path.join(start, '')
+    if abs_path.startswith(prefix):
+        return abs_path[len(prefix):]
     try:
-        print(f"🔄 Converting: {audio_path.relative_to(audio_path.parents[2])} -> {output_path.name}")
-        audio_to_mfcc(str(audio_path), str(output_path), device=device)
-        return str(output_path)
-    except Exception as e:
-        print(f"❌ Error converting {audio_path.name}: {e}")
-        return None
+        return os.path.relpath(abs_path, start)
+    except ValueError:
+        return path
 
 
 def generate_csv_from_persons(person_data, csv_output, labels=None):
@@ -137,7 +186,7 @@ def generate_csv_from_persons(person_data, csv_output, labels=None):
     Parameters:
     -----------
     person_data : dict
-        Dictionary mapping person names to lists of (audio_path, mfcc_path) tuples
+        Dictionary mapping person names to PersonFiles
     csv_output : str
         Path to output CSV file
     labels : dict, optional
@@ -146,12 +195,16 @@ def generate_csv_from_persons(person_data, csv_output, labels=None):
     csv_output = Path(csv_output)
     csv_output.parent.mkdir(parents=True, exist_ok=True)
     
-    rows = []
-    csv_dir = csv_output.parent
+    # CSV columns, filled per person (idtype is constant, added at the end)
+    columns = {'id': [], 'mfcc_npy_files': [], 'is_demented_at_recording': [], 'person_name': []}
+    cwd = os.getcwd()
+    csv_dir = os.path.abspath(csv_output.parent)
+    # Synthetic IDs already handed out (see synthetic_person_id)
+    synthetic_ids = set()
     
-    for person_name, files_list in person_data.items():
+    for person_name, person_files in sorted(person_data.items()):
         # Get all successful MFCC files for this person
-        mfcc_files = [mfcc for audio, mfcc in files_list if mfcc is not None]
+        mfcc_files = [mfcc for mfcc in person_files.mfcc if mfcc is not None]
         
         if not mfcc_files:
             print(f"⚠️  Warning: No valid MFCC files for {person_name}, skipping...")
@@ -160,58 +213,44 @@ def generate_csv_from_persons(person_data, csv_output, labels=None):
         # Get label (default to 0 if not provided)
         label = labels.get(person_name, 0) if labels else 0
         
-        # Convert to relative paths
-        mfcc_rel_paths = []
-        for mfcc_file in mfcc_files:
-            try:
-                mfcc_rel_path = os.path.relpath(mfcc_file, csv_dir)
-            except ValueError:
-                # If relative path fails, use absolute
-                mfcc_rel_path = mfcc_file
-            mfcc_rel_paths.append(mfcc_rel_path)
-        
-        # Format MFCC files as list string
-        mfcc_list_str = str(mfcc_rel_paths).replace("'", "'")
+        # Relative paths as a compact JSON array ('["a.npy","b.npy"]'), which
+        # AudioDataset reads with fhs_split_dataframe.parse_file_list
+        mfcc_list_str = json.dumps([relpath_or_abs(mfcc_file, csv_dir, cwd) for mfcc_file in mfcc_files],
+                                   separators=(',', ':'))
         
-        # Create a clean ID from person name
-        # Remove spaces and special characters, use first part
-        person_id = person_name.replace(' ', '_').replace('/', '_').upper()
-        # Extract numeric part if exists, otherwise use first 10 chars
-        import re
-        numbers = re.findall(r'\d+', person_id)
-        if numbers:
-            person_id_num = numbers[0].zfill(4)
+        # Numeric ID: the first run of digits in the name if there is one
+        number = DIGIT_RE.search(person_name)
+        if number:
+            person_id_num = number.group().zfill(4)
         else:
-            # Use hash of name to create unique numeric ID
-            person_id_num = str(abs(hash(person_name)) % 10000).zfill(4)
+            person_id_num = synthetic_person_id(person_name, synthetic_ids)
         
-        rows.append({
-            'idtype': 'FHS',
-            'id': person_id_num,
-            'mfcc_npy_files': mfcc_list_str,
-            'is_demented_at_recording': label,
-            'person_name': person_name  # Keep original name for reference
-        })
-    
-    if not rows:
+        columns['id'].append(person_id_num)
+        columns['mfcc_npy_files'].append(mfcc_list_str)
+        columns['is_demented_at_recording'].append(label)
+        columns['person_name'].append(person_name)  # Keep original name for reference
+    
+    if not columns['id']:
         print(f"\n⚠️  Warning: No successful conversions! CSV file not created.")
         print(f"   All audio file conversions failed. Please check the errors above.")
         return None
     
-    df = pd.DataFrame(rows)
-    # Reorder columns: person_name last for reference
-    cols = ['idtype', 'id', 'mfcc_npy_files', 'is_demented_at_recording', 'person_name']
-    df = df[cols]
-    df.to_csv(csv_output, index=False)
+    # Column order: person_name last for reference
+    df = pd.DataFrame({'idtype': ['FHS'] * len(columns['id']), **columns})
+    # Format in memory and write the file in one go, with '\n' line endings
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, lineterminator='\n')
+    Path(csv_output).write_text(buf.getvalue(), encoding='utf-8', newline='')
     
     print(f"\n✅ CSV file created: {csv_output}")
-    total_audio_files = sum(len([f for _, f in files if f is not None]) for files in person_data.values())
-    print(f"   Found {len(rows)} persons with {total_audio_files} audio files")
+    total_audio_files = sum(len(person_files.mfcc) - person_files.mfcc.count(None) for person_files in person_data.values())
+    print(f"   Found {len(df)} persons with {total_audio_files} audio files")
     
     return csv_output
 
 
-def auto_convert_directory(input_dir, output_dir=None, csv_output=None, device='cpu', overwrite=False, labels=None):
+def auto_convert_directory(input_dir, output_dir=None, csv_output=None, device='cpu', overwrite=False, labels=None,
+                           workers=None, batch_size=16, fp16=False):
     """
     Automatically convert all audio files in a directory and generate CSV.
     Handles nested structure: data/[Person Name]/[PersonName]_[number].wav
@@ -230,6 +269,13 @@ def auto_convert_directory(input_dir, output_dir=None, csv_output=None, device='
         Whether to overwrite existing .npy files
     labels : dict, optional
         Dictionary mapping person names to labels
+    workers : int, optional
+        Number of conversion processes (default: number of CPU cores; always
+        1 on GPU)
+    batch_size : int
+        Number of files passed through the MFCC extractor at once
+    fp16 : bool
+        Store the features as float16 (half the disk space)
     """
     input_dir = Path(input_dir)
     
@@ -275,27 +321,75 @@ def auto_convert_directory(input_dir, output_dir=None, csv_output=None, device='
     print()
     
     # Convert all audio files, maintaining folder structure
-    print("🔄 Converting audio files to MFCC features...")
-    person_data = {}
+    # e.g., data/Person Name/file.wav -> mfcc_features/Person Name/file.npy
+    # (plain string slicing: every found path starts with input_dir)
+    input_root_len = len(os.path.join(str(input_dir), ''))
+    output_root = str(output_dir)
+    audio_paths = []
+    mfcc_files = []
+    for person_name, audio_files in person_files.items():
+        for audio_file in audio_files:
+            relative_stem = os.path.splitext(str(audio_file)[input_root_len:])[0]
+            audio_paths.append(str(audio_file))
+            mfcc_files.append(os.path.join(output_root, relative_stem + '.npy'))
+    
+    # Existing .npy files are kept unless overwriting
+    todo = []
+    for i, (audio_file, output_file) in enumerate(zip(audio_paths, mfcc_files)):
+        if not overwrite and os.path.exists(output_file):
+            logger.debug(f"⏭️  Skipping {os.path.basename(audio_file)} (already exists: {os.path.basename(output_file)})")
+        else:
+            logger.debug(f"🔄 Converting: {os.path.basename(audio_file)} -> {os.path.basename(output_file)}")
+            todo.append(i)
+    
+    # Group files of similar size into batches for the MFCC extractor, so
+    # little padding is needed to bring each batch to a common length
+    todo.sort(key=lambda i: os.path.getsize(audio_paths[i]))
+    batches = [todo[k:k + batch_size] for k in range(0, len(todo), batch_size)]
+    
+    # Batches are independent and MFCC extraction is CPU-bound, so convert
+    # them in parallel across processes (GPU extraction stays in this process)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if device != 'cpu':
+        workers = 1
+    workers = max(1, min(workers, len(batches)))
+    
+    print(f"🔄 Converting audio files to MFCC features ({workers} worker(s))...")
+    if workers > 1:
+        # Each worker builds its MFCC extractor once, up front
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(device,)) as executor:
+            futures = [executor.submit(audio_to_mfcc_batch,
+                                       [audio_paths[i] for i in batch], [mfcc_files[i] for i in batch],
+                                       device, batch_size, fp16, loader_threads=1)
+                       for batch in batches]
+            converted = [mfcc_file for future in futures for mfcc_file in future.result()]
+    elif todo:
+        # Single process (e.g. GPU): audio_to_mfcc_batch loads the next batch
+        # in the background while the current one is converted
+        converted = audio_to_mfcc_batch([audio_paths[i] for i in todo], [mfcc_files[i] for i in todo],
+                                        device=device, batch_size=batch_size, fp16=fp16)
+    else:
+        converted = []
     
+    # Batch order is the todo order in both cases
+    for i, mfcc_file in zip(todo, converted):
+        mfcc_files[i] = mfcc_file
+        if mfcc_file is None:
+            logger.error(f"❌ Error converting {os.path.basename(audio_paths[i])}")
+    
+    # Regroup results by person (mfcc_files follows person_files order)
+    person_data = {}
+    results = iter(mfcc_files)
     for person_name, audio_files in person_files.items():
-        print(f"\n👤 Processing: {person_name} ({len(audio_files)} files)")
-        person_mfcc_files = []
-        
-        for i, audio_file in enumerate(audio_files, 1):
-            # Maintain folder structure in output
-            # e.g., data/Person Name/file.wav -> mfcc_features/Person Name/file.npy
-            relative_path = audio_file.relative_to(input_dir)
-            output_file = output_dir / relative_path.with_suffix('.npy')
-            
-            print(f"  [{i}/{len(audio_files)}] ", end='')
-            mfcc_file = convert_audio_to_mfcc(audio_file, output_file, device=device, overwrite=overwrite)
-            person_mfcc_files.append((audio_file, mfcc_file))
-        
-        person_data[person_name] = person_mfcc_files
+        person_data[person_name] = PersonFiles(list(audio_files), [next(results) for _ in audio_files])
+    
+    for handler in logger.handlers:
+        handler.flush()
     
     # Count successful conversions
-    successful = sum(1 for files in person_data.values() for _, mfcc in files if mfcc is not None)
+    successful = total_files - sum(files.mfcc.count(None) for files in person_data.values())
     print(f"\n✅ Successfully converted {successful}/{total_files} files")
     print()
     
@@ -357,10 +451,18 @@ Examples:
     parser.add_argument('input_dir', help='Directory containing audio files (e.g., "data" with person subdirectories)')
     parser.add_argument('--output-dir', help='Directory to save .npy files (default: data/mfcc_features)')
     parser.add_argument('--csv-output', help='Path to output CSV file (default: data/csv_files/dataset.csv)')
-    parser.add_argument('--device', default='cpu', help='Device to use: "cpu" or GPU index (default: cpu)')
+    parser.add_argument('--device', default='cpu',
+                        help='Device to use: "cpu", "cuda", "cuda:N" or GPU index (default: cpu)')
     parser.add_argument('--overwrite', action='store_true', help='Overwrite existing .npy files')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of parallel conversion processes (default: number of CPU cores)')
+    parser.add_argument('--batch-size', type=int, default=16,
+                        help='Number of files per MFCC extractor call (default: 16)')
+    parser.add_argument('--verbose', action='store_true', help='Log every file as it is converted')
+    parser.add_argument('--fp16', action='store_true', help='Save MFCC features as float16 (half the disk space)')
     
     args = parser.parse_args()
+    setup_logging(args.verbose)
     
     try:
         auto_convert_directory(
@@ -368,7 +470,10 @@ Examples:
             output_dir=args.output_dir,
             csv_output=args.csv_output,
             device=args.device,
-            overwrite=args.overwrite
+            overwrite=args.overwrite,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            fp16=args.fp16
         )
     except Exception as e:
         print(f"\n❌ Error: {e}", file=sys.stderr)
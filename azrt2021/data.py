@@ -38,8 +38,7 @@ class AudioDataset(Dataset):
         get_label = kwargs.get('get_label', lambda r: int(r['is_demented_at_recording']))
         get_label_kw = kwargs.get('get_label_kw', {})
 
-        get_files = kwargs.get('get_files', lambda r: r['mfcc_npy_files']\
-            .strip('[]').replace('\'', '').split(', '))
+        get_files = kwargs.get('get_files', lambda r: fhs_sdf.parse_file_list(r['mfcc_npy_files']))
         get_files_kw = kwargs.get('get_files_kw', {})
 
         get_row_data = kwargs.get('get_row_data', fhs_sdf.get_row_data)
@@ -101,7 +100,8 @@ class AudioDataset(Dataset):
         start = self.df_dat.loc[idx, 'start']
         end = self.df_dat.loc[idx, 'end']
 
-        fea = np.load(self.df_dat.loc[idx, 'audio_fn'])
+        # features may be stored as float16; the models expect float32
+        fea = np.load(self.df_dat.loc[idx, 'audio_fn']).astype(np.float32, copy=False)
         try:
             if (start is not None and end is not None) and\
                 (not np.isnan(start) and not np.isnan(end)):
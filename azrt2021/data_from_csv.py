@@ -36,7 +36,8 @@ class AudioDatasetFromCsv(Dataset):
         else:
             start = self.df_dat.loc[idx, 'start'] if 'start' in self.df_dat.loc[idx] else None
             end = self.df_dat.loc[idx, 'end'] if 'end' in self.df_dat.loc[idx] else None
-            fea = np.load(self.df_dat.loc[idx, 'audio_fn'])
+            # features may be stored as float16; the models expect float32
+            fea = np.load(self.df_dat.loc[idx, 'audio_fn']).astype(np.float32, copy=False)
         try:
             if (start is not None and end is not None) and\
                 (not np.isnan(start) and not np.isnan(end)):
@@ -4,6 +4,7 @@ functions meant to split the dataset into
 training and validation sets;
 """
 import os
+import json
 import random
 import numpy as np
 
@@ -102,6 +103,15 @@ def get_holdout_fold(sample_ids, test_ids, folds, vld_idx, mode):
         current_mode_ids = sample_ids[idx]
     return current_mode_ids
 
+def parse_file_list(cell):
+    """
+    parse a list of paths stored in a csv cell; accepts JSON arrays
+    (as written by the conversion scripts) and the legacy "['a', 'b']" format;
+    """
+    if cell.startswith('["'):
+        return json.loads(cell)
+    return cell.strip('[]').replace('\'', '').split(', ')
+
 def get_row_data(row, pid, lbl, fns, **kwargs):
     """
     get row data from row, label, and files;
@@ -109,9 +119,8 @@ def get_row_data(row, pid, lbl, fns, **kwargs):
     segment_audio = kwargs.get('segment_audio')
     segment_audio_kw = kwargs.get('segment_audio_kw', {})
     row_data_list = []
-    transcript_fns = row['duration_csv_out_list']
-    transcript_fns = transcript_fns.replace('\\', '/')
-    transcript_fns = transcript_fns.strip('[]').replace('\'', '').split(', ')
+    transcript_fns = parse_file_list(row['duration_csv_out_list'])
+    transcript_fns = [fn.replace('\\', '/') for fn in transcript_fns]
     has_transcripts = transcript_fns != [""]
     if has_transcripts:
         assert len(transcript_fns) == len(fns), f"{fns}, {transcript_fns}"
@@ -137,7 +146,7 @@ def segment_mfcc(mfcc_npy, **kwargs):
     win_len_ms = kwargs.get('win_len_ms', 10)
     segment_length_min = kwargs.get('segment_length_min', 5)
     do_return_array = kwargs.get('do_return_array', False)
-    array = np.load(mfcc_npy)
+    array = np.load(mfcc_npy).astype(np.float32, copy=False)
     windows_per_minute = 60 * 1000 / win_len_ms
     ## mfcc windows per minute
     ## 60 * 1000 / 10 -> 6000
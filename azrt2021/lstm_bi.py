@@ -104,6 +104,7 @@ class LSTM(nn.Module):
         for i in range(len(Xs)):
             Xs[i] = reshape_(Xs[i], n_concat, 200)
             Xs[i] = torch.tensor(Xs[i], dtype=torch.float32, device=self.device)
+        return Xs
 
 class _Module_LSTM(nn.Module):
     """
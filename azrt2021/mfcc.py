@@ -5,6 +5,7 @@ Created on Wed Jul 29 03:00:04 2020
 
 @author: cxue2
 """
+from functools import lru_cache
 import numpy as np
 try:
     import cupy as cp
@@ -12,6 +13,181 @@ try:
 except ImportError:
     HAS_CUPY = False
     cp = None
+try:
+    import torch
+    HAS_TORCH = True
+except ImportError:
+    HAS_TORCH = False
+    torch = None
+try:
+    import numba
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+    numba = None
+
+
+@lru_cache(maxsize=8)
+def _fft_tables(nfft):
+    """
+    bit-reversal permutation and twiddle factors for the half-length complex
+    FFT used by _mfcc_core (cached, read-only);
+    """
+    m = nfft // 2
+    bits = int(np.log2(m))
+    rev = np.array([int(format(i, '0{}b'.format(bits))[::-1], 2) for i in range(m)],
+        dtype=np.int64)
+    # twiddles of the half-length FFT and of the real-FFT post-processing step
+    tw_m = np.exp(-2j * np.pi * np.arange(m) / m)
+    tw_n = np.exp(-2j * np.pi * np.arange(m + 1) / nfft)
+    return _read_only(rev, tw_m.real.copy(), tw_m.imag.copy(), tw_n.real.copy(), tw_n.imag.copy())
+
+
+def _read_only(*arrs):
+    """
+    mark cached operator arrays read-only, they are shared by all extractors;
+    """
+    for arr in arrs:
+        arr.flags.writeable = False
+    return arrs
+
+
+@lru_cache(maxsize=8)
+def _mel_filter_bank(samplerate, nfft, nfilt):
+    """
+    get mel filterbank (cached, read-only);
+    """
+    # placeholder for filter bank
+    bnk = np.zeros((nfilt, int(np.floor(nfft / 2 + 1))), dtype=np.float32)
+    frq_mel =\
+        (0, 2595 * np.log10(1 + (samplerate / 2) / 700))  # (low, high)
+    mel_pts = np.linspace(frq_mel[0], frq_mel[1],
+        nfilt + 2)    # equally spaced in Mel scale
+    hz__pts = 700 * (10 ** (mel_pts / 2595) - 1)                     # convert Mel to Hz
+    idc = np.floor((nfft + 1) * hz__pts / samplerate).astype(np.int64)
+    for m in range(1, nfilt + 1):
+        f_m_l = idc[m-1]  # left
+        f_m_c = idc[m]    # center
+        f_m_r = idc[m+1]  # right
+        for k in range(f_m_l, f_m_c):
+            bnk[m-1,k] = (k - idc[m-1]) / (idc[m] - idc[m-1])
+        for k in range(f_m_c, f_m_r):
+            bnk[m-1,k] = (idc[m+1] - k) / (idc[m+1] - idc[m])
+    return _read_only(bnk)[0]
+
+
+@lru_cache(maxsize=8)
+def _dct_mat_type_2(nfilt):
+    """
+    calc dct matrix (cached, read-only);
+    """
+    # placeholder for dct matrix
+    mat = np.zeros((nfilt, nfilt), dtype=np.float32)
+    for k in range(nfilt):
+        mat[k,:] = np.pi * k * (2 * np.arange(nfilt) + 1) / (2 * nfilt)
+        mat[k,:] = 2 * np.cos(mat[k,:])
+    return _read_only(mat)[0]
+
+
+def _mfcc_frame(arr, start, winlen, nfft, preemph, rev, tw_m_re, tw_m_im, tw_n_re,
+                tw_n_im, bnk, bnk_lo, bnk_hi, dct_mat, dct_scl, lft, z_re, z_im, pwr,
+                mel, out):
+    """
+    MFCC of the frame starting at arr[start]; z_re, z_im, pwr and mel are
+    scratch buffers, the coefficients are written to out;
+    """
+    half = nfft // 2
+    eps = np.finfo(np.float32).eps
+    # step 0 + 1: pre-emphasized frame, packed as a half-length complex
+    # sequence (even samples real, odd samples imaginary), bit-reversed
+    z_re[:] = 0.
+    z_im[:] = 0.
+    for n in range(winlen):
+        i = start + n
+        v = arr[i] - preemph * arr[i - 1] if i > 0 else arr[i]
+        if n % 2 == 0:
+            z_re[rev[n // 2]] = v
+        else:
+            z_im[rev[n // 2]] = v
+    # step 2.2: radix-2 FFT of the packed sequence
+    size = 2
+    while size <= half:
+        step = half // size
+        hs = size // 2
+        for b in range(0, half, size):
+            for j in range(hs):
+                w_re = tw_m_re[j * step]
+                w_im = tw_m_im[j * step]
+                p = b + j
+                q = p + hs
+                t_re = w_re * z_re[q] - w_im * z_im[q]
+                t_im = w_re * z_im[q] + w_im * z_re[q]
+                z_re[q] = z_re[p] - t_re
+                z_im[q] = z_im[p] - t_im
+                z_re[p] += t_re
+                z_im[p] += t_im
+        size *= 2
+    # step 2.3: unpack the real FFT and convert to power spectrum
+    eng = 0.
+    for k in range(half + 1):
+        a_re = z_re[k % half]
+        a_im = z_im[k % half]
+        b_re = z_re[(half - k) % half]
+        b_im = -z_im[(half - k) % half]
+        e_re = .5 * (a_re + b_re)
+        e_im = .5 * (a_im + b_im)
+        o_re = .5 * (a_im - b_im)
+        o_im = -.5 * (a_re - b_re)
+        x_re = e_re + tw_n_re[k] * o_re - tw_n_im[k] * o_im
+        x_im = e_im + tw_n_re[k] * o_im + tw_n_im[k] * o_re
+        pwr[k] = (x_re * x_re + x_im * x_im) / nfft / nfft
+        eng += pwr[k]
+    # tatal energy
+    eng *= nfft
+    if eng == 0:
+        eng = eps
+    # step 3: apply Mel filter bank (only over each filter's support)
+    for m in range(bnk.shape[0]):
+        acc = 0.
+        for k in range(bnk_lo[m], bnk_hi[m]):
+            acc += pwr[k] * bnk[m, k]
+        mel[m] = np.log(acc if acc != 0 else eps)
+    # step 4: DCT and lifter; 0th coefficient replaced by log total energy
+    for c in range(out.shape[0]):
+        acc = 0.
+        for m in range(bnk.shape[0]):
+            acc += mel[m] * dct_mat[c, m]
+        out[c] = acc * dct_scl[c] * lft[c]
+    out[0] = np.log(eng)
+
+
+def _mfcc_core(arr, winlen, winstep, nfft, preemph, rev, tw_m_re, tw_m_im, tw_n_re,
+               tw_n_im, bnk, bnk_lo, bnk_hi, dct_mat, dct_scl, lft, numcep, n_threads):
+    """
+    fused MFCC kernel for one audio sequence: frames are processed in
+    parallel chunks and never materialize as a (frames x winlen) or
+    (frames x nfft) matrix; mirrors MFCC_Extractor.__call__;
+    """
+    seq_len = (arr.shape[0] - winlen) // winstep + 1
+    out = np.empty((seq_len, numcep), dtype=np.float64)
+    n_chunks = max(min(n_threads, seq_len), 1)
+    for chunk in numba.prange(n_chunks):
+        # thread-local buffers, reused for every frame in the chunk
+        z_re = np.empty(nfft // 2)
+        z_im = np.empty(nfft // 2)
+        pwr = np.empty(nfft // 2 + 1)
+        mel = np.empty(bnk.shape[0])
+        for f in range(chunk * seq_len // n_chunks, (chunk + 1) * seq_len // n_chunks):
+            _mfcc_frame(arr, f * winstep, winlen, nfft, preemph, rev, tw_m_re, tw_m_im,
+                        tw_n_re, tw_n_im, bnk, bnk_lo, bnk_hi, dct_mat, dct_scl, lft,
+                        z_re, z_im, pwr, mel, out[f])
+    return out
+
+
+if HAS_NUMBA:
+    _mfcc_frame = numba.njit(cache=True, fastmath=True)(_mfcc_frame)
+    _mfcc_core = numba.njit(cache=True, parallel=True, fastmath=True)(_mfcc_core)
+
 
 class MFCC_Extractor():
     """
@@ -33,9 +209,9 @@ class MFCC_Extractor():
         self.preemph    = preemph
         self.ceplifter  = ceplifter
         self.nfft = int(2 ** np.ceil(np.log2(self.winlen))) if nfft == 'POW2' else self.winlen
-        # construct Mel filter bank
+        # construct Mel filter bank (operators are built once per
+        # configuration and shared between extractors)
         self.bnk = self._mel_filter_bank()
-        self.bnk = self.bnk.astype(np.float32)
         # DCT matrix (type 2)
         self.dct_mat = self._dct_mat_type_2()
         self.dct_scl = np.zeros((nfilt,), dtype=np.float32) # for orthogonal transformation
@@ -44,10 +220,31 @@ class MFCC_Extractor():
         # cepstrum lifter
         self.lft = 1 + (ceplifter / 2) * np.sin(np.pi * np.arange(numcep) / ceplifter)
         self.lft = self.lft.astype(np.float32)
-        # set device
+        # set device; 'cuda', 'cuda:1' and '1' all name a GPU index
+        if isinstance(device, str) and device != 'cpu':
+            device = 0 if device == 'cuda' else int(device.split(':')[-1])
         self.device = device
+        # the fused kernel needs a power-of-2 FFT length; on a single core
+        # numpy's FFT is as fast, the kernel wins by spreading frames over cores
+        self.use_jit = (HAS_NUMBA and device == 'cpu' and nfft == 'POW2'
+                        and numba.config.NUMBA_NUM_THREADS > 1)
+        if self.use_jit:
+            self._fft_tbl = _fft_tables(self.nfft)
+            nz = self.bnk != 0
+            self._bnk_lo = np.argmax(nz, axis=1).astype(np.int64)
+            self._bnk_hi = (nz.shape[1] - np.argmax(nz[:, ::-1], axis=1)).astype(np.int64)
+            self._bnk_hi[~nz.any(axis=1)] = 0
+            self._bnk64 = self.bnk.astype(np.float64)
+            self._dct64 = self.dct_mat.astype(np.float64)
+            self._scl64 = self.dct_scl.astype(np.float64)
+            self._lft64 = self.lft.astype(np.float64)
         if device == 'cpu':
             self.backend = np
+        elif not HAS_CUPY and HAS_TORCH:
+            # no cupy: run the same pipeline on the GPU with torch
+            self.backend = torch
+            self._torch_device = torch.device('cuda', device)
+            self._torch_ops = {}
         else:
             if not HAS_CUPY:
                 raise ImportError("cupy is required for GPU processing. Install with: pip install cupy")
@@ -73,6 +270,10 @@ class MFCC_Extractor():
         numpy.ndarry of shape (batch_size, # of chunks, # of ceps)
             MFCC features.
         """
+        if self.use_jit and np.issubdtype(np.asarray(arr).dtype, np.floating):
+            return self._call_jit(np.asarray(arr))
+        if self.backend is torch:
+            return self._call_torch(arr)
         # mount to device
         tmp = np.copy(arr) if self.device == 'cpu' else cp.asarray(arr)
         # flatten array except the last dimension
@@ -114,6 +315,58 @@ class MFCC_Extractor():
 #            cp.get_default_memory_pool().free_all_blocks()
         return tmp
 
+    def _call_jit(self, arr):
+        """
+        extract MFCC features with the numba-compiled kernel;
+        """
+        shp = arr.shape
+        seqs = arr.reshape((-1, shp[-1]))
+        # same result precision as the vectorized path
+        dtype = np.result_type(arr.dtype, np.float32)
+        rsl = [_mfcc_core(np.ascontiguousarray(seq, dtype=np.float64), self.winlen,
+                          self.winstep, self.nfft, self.preemph, *self._fft_tbl,
+                          self._bnk64, self._bnk_lo, self._bnk_hi, self._dct64,
+                          self._scl64, self._lft64, self.numcep,
+                          numba.get_num_threads()) for seq in seqs]
+        seq_len = rsl[0].shape[0]
+        return np.stack(rsl).astype(dtype, copy=False).reshape(shp[:-1] + (seq_len, -1))
+
+    def _call_torch(self, arr):
+        """
+        extract MFCC features with torch on the GPU; mirrors __call__ and
+        returns a numpy array;
+        """
+        arr = np.asarray(arr)
+        dtype = torch.float64 if arr.dtype == np.float64 else torch.float32
+        tmp = torch.as_tensor(arr).to(self._torch_device, dtype, non_blocking=True)
+        # operators in the input precision, moved to the GPU once
+        if dtype not in self._torch_ops:
+            self._torch_ops[dtype] = [torch.tensor(op).to(self._torch_device, dtype)
+                for op in (self.bnk, self.dct_mat, self.dct_scl, self.lft)]
+        bnk, dct_mat, dct_scl, lft = self._torch_ops[dtype]
+        eps = np.finfo(np.float32).eps
+        shp = tmp.shape
+        tmp = tmp.reshape((-1, shp[-1]))
+        # step 0: pre-emphasis
+        tmp = torch.cat((tmp[:,:1], tmp[:,1:] - self.preemph * tmp[:,:-1]), dim=1)
+        # step 1: split audio into chunks (a view, no copy)
+        tmp = tmp.unfold(1, self.winlen, self.winstep)
+        seq_len = tmp.shape[1]
+        # step 2.2 + 2.3: FFT and power spectrum
+        tmp = torch.fft.rfft(tmp, n=self.nfft, norm='ortho')
+        tmp = (tmp.real ** 2 + tmp.imag ** 2) / self.nfft
+        # tatal energy
+        eng = tmp.sum(-1) * self.nfft
+        eng = torch.where(eng == 0, eps, eng)
+        # step 3: apply Mel filter bank
+        tmp = tmp @ bnk.T
+        tmp = torch.log(torch.where(tmp == 0, eps, tmp))
+        # step 4: DCT, lifter and log total energy
+        tmp = (tmp @ dct_mat.T) * dct_scl
+        tmp = tmp[...,:self.numcep] * lft
+        tmp[...,0] = torch.log(eng)
+        return tmp.reshape(shp[:-1] + (seq_len, -1)).cpu().numpy()
+
     def _strided_split(self, arr):
         """
         split with strides;
@@ -133,31 +386,10 @@ class MFCC_Extractor():
         """
         get mel filterbank;
         """
-        # placeholder for filter bank
-        bnk = np.zeros((self.nfilt, int(np.floor(self.nfft / 2 + 1))), dtype=np.float32)
-        frq_mel =\
-            (0, 2595 * np.log10(1 + (self.samplerate / 2) / 700))  # (low, high)
-        mel_pts = np.linspace(frq_mel[0], frq_mel[1],
-            self.nfilt + 2)    # equally spaced in Mel scale
-        hz__pts = 700 * (10 ** (mel_pts / 2595) - 1)                     # convert Mel to Hz
-        idc = np.floor((self.nfft + 1) * hz__pts / self.samplerate).astype(np.int64)
-        for m in range(1, self.nfilt + 1):
-            f_m_l = idc[m-1]  # left
-            f_m_c = idc[m]    # center
-            f_m_r = idc[m+1]  # right
-            for k in range(f_m_l, f_m_c):
-                bnk[m-1,k] = (k - idc[m-1]) / (idc[m] - idc[m-1])
-            for k in range(f_m_c, f_m_r):
-                bnk[m-1,k] = (idc[m+1] - k) / (idc[m+1] - idc[m])
-        return bnk
+        return _mel_filter_bank(self.samplerate, self.nfft, self.nfilt)
 
     def _dct_mat_type_2(self):
         """
         calc dct matrix;
         """
-        # placeholder for dct matrix
-        mat = np.zeros((self.nfilt, self.nfilt), dtype=np.float32)
-        for k in range(self.nfilt):
-            mat[k,:] = np.pi * k * (2 * np.arange(self.nfilt) + 1) / (2 * self.nfilt)
-            mat[k,:] = 2 * np.cos(mat[k,:])
-        return mat
+        return _dct_mat_type_2(self.nfilt)
@@ -89,7 +89,7 @@ class Model:
                     ascii=True, bar_format='{l_bar}{r_bar}', file=sys.stdout) as pbar:
                     for Xs, ys, _ in dldr_trn:
                         # mount data to device
-                        self.nn.reformat(Xs, self.n_concat)
+                        Xs = self.nn.reformat(Xs, self.n_concat)
 
                         ys = torch.tensor(ys, dtype=torch.long, device=self.nn.device)
                         # forward and backward propagation
@@ -152,12 +152,13 @@ class Model:
         rsl = []
         # evaluation loop
         rest_of_info_list = []
-        with torch.set_grad_enabled(False):
+        # inference_mode also skips version-counter and view tracking
+        with torch.inference_mode():
             with tqdm(total=len(dset), desc='Epoch ___ (EVL)', ascii=True,
                 bar_format='{l_bar}{r_bar}', file=sys.stdout) as pbar:
                 for Xs, *rest_of_info in dldr:
                     rest_of_info_list.append(rest_of_info)
-                    self.nn.reformat(Xs, self.n_concat)
+                    Xs = self.nn.reformat(Xs, self.n_concat)
                     out = self.nn.get_scores(Xs)
                     # append batch outputs to result
                     rsl.append(out.data.cpu().numpy())
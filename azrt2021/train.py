@@ -10,7 +10,7 @@ import sys
 import random
 from datetime import datetime
 import torch
-from fhs_split_dataframe import segment_mfcc, has_transcript_and_mri
+from fhs_split_dataframe import segment_mfcc, has_transcript_and_mri, parse_file_list
 from handle_input import get_args
 from select_task import select_task
 from data import AudioDataset
@@ -55,9 +55,8 @@ def get_row_data_simple(row, pid, lbl, fns, csv_path=None, **kwargs):
     
     # Handle transcript files - use empty if column doesn't exist
     if 'duration_csv_out_list' in row and pd.notna(row['duration_csv_out_list']):
-        transcript_fns = str(row['duration_csv_out_list'])
-        transcript_fns = transcript_fns.replace('\\', '/')
-        transcript_fns = transcript_fns.strip('[]').replace('\'', '').split(', ')
+        transcript_fns = parse_file_list(str(row['duration_csv_out_list']))
+        transcript_fns = [fn.replace('\\', '/') for fn in transcript_fns]
         has_transcripts = transcript_fns != [""] and len(transcript_fns) > 0
     else:
         transcript_fns = [""] * len(fns)
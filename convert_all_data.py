@@ -20,49 +20,80 @@ Example:
 
 import sys
 import os
+
+# Files are converted in parallel worker processes; one BLAS/OpenMP thread
+# each keeps the workers from oversubscribing the cores. Must be set before
+# numpy is imported to take effect.
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+
 import argparse
+import hashlib
+import io
+import json
+import re
 import pandas as pd
 from pathlib import Path
-import numpy as np
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
 
-# Import the preprocessing function
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Shared preprocessing (installed with the project: pip install -e .)
 try:
-    from preprocess_audio import audio_to_mfcc, load_audio_file
-except ImportError:
-    import numpy as np
-    try:
-        import librosa
-        HAS_LIBROSA = True
-    except ImportError:
-        HAS_LIBROSA = False
-    
-    from azrt2021.mfcc import MFCC_Extractor
-    
-    def load_audio_file(audio_path, sr=16000):
-        """Load audio file."""
-        if not os.path.isfile(audio_path):
-            raise FileNotFoundError(f"Audio file not found: {audio_path}")
-        if HAS_LIBROSA:
-            audio, _ = librosa.load(audio_path, sr=sr, mono=True)
-            return audio
-        raise RuntimeError("librosa required. Install: pip install librosa")
-    
-    def audio_to_mfcc(audio_path, output_path, device='cpu', **mfcc_kwargs):
-        """Convert audio to MFCC."""
-        audio = load_audio_file(audio_path)
-        mfcc_extractor = MFCC_Extractor(
-            samplerate=16000, winlen=0.025, winstep=0.01, numcep=13,
-            nfilt=26, device=device, **mfcc_kwargs
-        )
-        audio_batch = audio.reshape(1, -1)
-        mfcc_features = mfcc_extractor(audio_batch)[0]
-        os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else '.', exist_ok=True)
-        np.save(output_path, mfcc_features)
+    from preprocess_audio import audio_to_mfcc_batch, get_mfcc_extractor
+except ImportError as e:
+    raise ImportError(
+        f"Could not import preprocess_audio ({e}). Run this script from the voice_model "
+        f"directory or install the project with: pip install -e ."
+    ) from e
 
 # Audio file extensions to process
 AUDIO_EXTENSIONS = ['.mp3', '.wav', '.flac', '.m4a', '.ogg', '.aac']
+AUDIO_EXTENSION_SET = frozenset(AUDIO_EXTENSIONS)
+
+# First run of digits in a person name, used as the CSV id
+DIGIT_RE = re.compile(r'\d+')
+
+
+class PersonFiles():
+    """
+    A person's audio files and the matching MFCC files (None where the
+    conversion failed), kept as two parallel lists.
+    """
+    __slots__ = ('audio', 'mfcc')
+    
+    def __init__(self, audio=None, mfcc=None):
+        self.audio = [] if audio is None else audio
+        self.mfcc = [] if mfcc is None else mfcc
+    
+    def append(self, audio_file, mfcc_file):
+        self.audio.append(audio_file)
+        self.mfcc.append(mfcc_file)
+    
+    def __len__(self):
+        return len(self.mfcc)
+
+
+def scan_audio_files(root):
+    """Yield the paths of all audio files under root in one os.scandir pass."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSION_SET and entry.is_file():
+                    yield entry.path
+
+
+def _init_worker(device):
+    """Process pool initializer: one compute thread and the MFCC extractor built once."""
+    try:
+        import numba
+        numba.set_num_threads(1)
+    except ImportError:
+        pass
+    get_mfcc_extractor(device)
 
 
 def find_audio_files_by_person(directory):
@@ -70,7 +101,7 @@ def find_audio_files_by_person(directory):
     Find all audio files grouped by person (folder name).
     
     Returns:
-        dict: {person_name: [list of audio file paths]}
+        dict: {person_name: [list of audio file path strings]}
     """
     directory = Path(directory)
     
@@ -80,50 +111,124 @@ def find_audio_files_by_person(directory):
     # Dictionary to group files by person (folder name)
     person_files = defaultdict(list)
     
-    # Find all audio files
-    for ext in AUDIO_EXTENSIONS:
-        for audio_file in directory.rglob(f'*{ext}'):
-            # Get the parent directory name (person name)
-            person_name = audio_file.parent.name
-            
-            # Skip if parent is the root data directory itself
-            if person_name == directory.name or person_name == 'data':
-                # Try to get the next level up
-                if audio_file.parent.parent != directory:
-                    person_name = audio_file.parent.parent.name
-                else:
-                    # If file is directly in data/, use filename as person name
-                    person_name = audio_file.stem.split('_')[0]
-            
-            person_files[person_name].append(audio_file)
+    # Find all audio files (single traversal for all extensions)
+    root = str(directory)
+    for audio_file in scan_audio_files(root):
+        # Get the parent directory name (person name)
+        parent = os.path.dirname(audio_file)
+        person_name = os.path.basename(parent)
+        
+        # Skip if parent is the root data directory itself
+        if person_name == directory.name or person_name == 'data':
+            # Try to get the next level up
+            grandparent = os.path.dirname(parent)
+            if os.path.normpath(grandparent) != os.path.normpath(root):
+                person_name = os.path.basename(grandparent)
+            else:
+                # If file is directly in data/, use filename as person name
+                person_name = os.path.splitext(os.path.basename(audio_file))[0].split('_')[0]
+        
+        person_files[person_name].append(audio_file)
     
     return person_files
 
 
-def convert_audio_to_mfcc(audio_path, output_dir, person_name, device='cpu'):
+def find_mfcc_by_person(mfcc_dir, person_names):
+    """
+    Find existing MFCC files for the given persons (output_dir/person/*.npy).
+    
+    Returns:
+        dict: {person_name: [sorted .npy path strings]} for persons that have any
+    """
+    person_mfcc = {}
+    for person_name in person_names:
+        person_dir = os.path.join(mfcc_dir, person_name)
+        try:
+            with os.scandir(person_dir) as entries:
+                npy_files = sorted(entry.path for entry in entries
+                                   if entry.name.endswith('.npy') and entry.is_file())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if npy_files:
+            person_mfcc[person_name] = npy_files
+    return person_mfcc
+
+
+def mfcc_cache_key(audio_path, device='cpu', fp16=False):
     """
-    Convert a single audio file to MFCC .npy format.
+    Describe the source file and extractor settings an MFCC .npy was built from.
     
     Returns:
-        Path to the created .npy file, or None if conversion failed
+        dict of the audio file's size and mtime, the MFCC parameters and the
+        stored precision
     """
+    st = os.stat(audio_path)
+    mfcc_extractor = get_mfcc_extractor(device)
+    return {
+        'st_size': st.st_size,
+        'st_mtime_ns': st.st_mtime_ns,
+        'sr': mfcc_extractor.samplerate,
+        'winlen': mfcc_extractor.winlen,
+        'winstep': mfcc_extractor.winstep,
+        'numcep': mfcc_extractor.numcep,
+        'nfilt': mfcc_extractor.nfilt,
+        'fp16': fp16,
+    }
+
+
+def is_mfcc_cached(audio_path, output_file, device='cpu', fp16=False):
+    """Check whether output_file is up to date according to its .meta.json sidecar."""
+    output_file = Path(output_file)
     try:
-        # Create output path: output_dir/person_name/filename.npy
-        audio_path = Path(audio_path)
-        output_dir = Path(output_dir)
-        person_dir = output_dir / person_name
-        person_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Create output filename
-        output_file = person_dir / f"{audio_path.stem}.npy"
-        
-        # Convert to MFCC
-        audio_to_mfcc(str(audio_path), str(output_file), device=device)
-        
-        return output_file
-    except Exception as e:
-        print(f"   ❌ Error converting {audio_path}: {e}")
-        return None
+        with open(output_file.with_suffix('.meta.json')) as f:
+            meta = json.load(f)
+        return output_file.exists() and meta == mfcc_cache_key(audio_path, device, fp16)
+    except (OSError, ValueError):
+        return False
+
+
+def write_mfcc_cache_meta(audio_path, output_file, device='cpu', fp16=False):
+    """Record what output_file was built from in its .meta.json sidecar (atomically)."""
+    meta_file = Path(output_file).with_suffix('.meta.json')
+    tmp_file = meta_file.with_suffix('.json.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(mfcc_cache_key(audio_path, device, fp16), f)
+    os.replace(tmp_file, meta_file)
+
+
+def synthetic_person_id(person_name, used_ids):
+    """
+    Four-digit ID for a person whose name has no digits.
+    
+    Derived from a blake2b digest of the name, so a person keeps the same ID
+    across runs and as other persons are added; on a clash with an ID in
+    used_ids the next free number is taken (persons are visited in sorted
+    order, so this is deterministic too). The result is added to used_ids.
+    """
+    num = int.from_bytes(hashlib.blake2b(person_name.encode('utf-8'), digest_size=4).digest(), 'big') % 10000
+    while f"{num:04d}" in used_ids and len(used_ids) < 10000:
+        num = (num + 1) % 10000
+    used_ids.add(f"{num:04d}")
+    return f"{num:04d}"
+
+
+def relpath_or_abs(path, start, cwd):
+    """
+    os.path.relpath(path, start), or path unchanged when it has no relative
+    form (e.g. another drive).
+    
+    Relative paths are resolved against cwd, looked up once by the caller,
+    instead of by relpath on every call; paths under start (which must be
+    absolute and normalized) just have the prefix stripped.
+    """
+    abs_path = os.path.normpath(os.path.join(cwd, path))
+    prefix = os.path.join(start, '')
+    if abs_path.startswith(prefix):
+        return abs_path[len(prefix):]
+    try:
+        return os.path.relpath(abs_path, start)
+    except ValueError:
+        return path
 
 
 def generate_csv_from_persons(person_data, csv_output, label, labels_dict=None):
@@ -133,7 +238,7 @@ def generate_csv_from_persons(person_data, csv_output, label, labels_dict=None):
     Parameters:
     -----------
     person_data : dict
-        {person_name: [(audio_path, mfcc_path), ...]}
+        {person_name: PersonFiles}
     csv_output : Path
         Output CSV file path
     label : int
@@ -141,11 +246,15 @@ def generate_csv_from_persons(person_data, csv_output, label, labels_dict=None):
     labels_dict : dict, optional
         {person_name: label} to override default label per person
     """
-    rows = []
-    csv_dir = csv_output.parent
-    
-    for person_name, files_list in person_data.items():
-        mfcc_files = [mfcc for audio, mfcc in files_list if mfcc is not None]
+    # CSV columns, filled per person (idtype is constant, added at the end)
+    columns = {'id': [], 'mfcc_npy_files': [], 'is_demented_at_recording': [], 'person_name': []}
+    cwd = os.getcwd()
+    csv_dir = os.path.abspath(csv_output.parent)
+    # Synthetic IDs already handed out (see synthetic_person_id)
+    synthetic_ids = set()
+    
+    for person_name, person_files in sorted(person_data.items()):
+        mfcc_files = [mfcc for mfcc in person_files.mfcc if mfcc is not None]
         
         if not mfcc_files:
             print(f"⚠️  Warning: No valid MFCC files for {person_name}, skipping...")
@@ -154,51 +263,41 @@ def generate_csv_from_persons(person_data, csv_output, label, labels_dict=None):
         # Use label from labels_dict if provided, otherwise use default
         person_label = labels_dict.get(person_name, label) if labels_dict else label
         
-        mfcc_rel_paths = []
-        for mfcc_file in mfcc_files:
-            try:
-                mfcc_rel_path = os.path.relpath(mfcc_file, csv_dir)
-            except ValueError:
-                mfcc_rel_path = mfcc_file
-            mfcc_rel_paths.append(mfcc_rel_path)
-        
-        mfcc_list_str = str(mfcc_rel_paths).replace("'", "'")
+        mfcc_list_str = json.dumps([relpath_or_abs(mfcc_file, csv_dir, cwd) for mfcc_file in mfcc_files],
+                                   separators=(',', ':'))
         
         # Generate person ID
-        person_id = person_name.replace(' ', '_').replace('/', '_').upper()
-        import re
-        numbers = re.findall(r'\d+', person_id)
-        if numbers:
-            person_id_num = numbers[0].zfill(4)
+        number = DIGIT_RE.search(person_name)
+        if number:
+            person_id_num = number.group().zfill(4)
         else:
-            person_id_num = str(abs(hash(person_name)) % 10000).zfill(4)
+            person_id_num = synthetic_person_id(person_name, synthetic_ids)
         
-        rows.append({
-            'idtype': 'FHS',
-            'id': person_id_num,
-            'mfcc_npy_files': mfcc_list_str,
-            'is_demented_at_recording': person_label,
-            'person_name': person_name
-        })
-    
-    if not rows:
+        columns['id'].append(person_id_num)
+        columns['mfcc_npy_files'].append(mfcc_list_str)
+        columns['is_demented_at_recording'].append(person_label)
+        columns['person_name'].append(person_name)
+    
+    if not columns['id']:
         print(f"\n⚠️  Warning: No successful conversions! CSV file not created.")
         print(f"   All audio file conversions failed. Please check the errors above.")
         return None
     
-    df = pd.DataFrame(rows)
-    cols = ['idtype', 'id', 'mfcc_npy_files', 'is_demented_at_recording', 'person_name']
-    df = df[cols]
-    df.to_csv(csv_output, index=False)
+    df = pd.DataFrame({'idtype': ['FHS'] * len(columns['id']), **columns})
+    # Format in memory and write the file in one go, with '\n' line endings
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, lineterminator='\n')
+    Path(csv_output).write_text(buf.getvalue(), encoding='utf-8', newline='')
     
     print(f"\n✅ CSV file created: {csv_output}")
-    total_audio_files = sum(len([f for _, f in files if f is not None]) for files in person_data.values())
-    print(f"   Found {len(rows)} persons with {total_audio_files} audio files")
+    total_audio_files = sum(len(person_files.mfcc) - person_files.mfcc.count(None) for person_files in person_data.values())
+    print(f"   Found {len(df)} persons with {total_audio_files} audio files")
     
     return csv_output
 
 
-def process_directory(input_dir, output_dir, label, device='cpu'):
+def process_directory(input_dir, output_dir, label, device='cpu', batch_size=32, force=False,
+                      convert=True, workers=None, fp16=False):
     """
     Process a directory of audio files and convert them to MFCC.
     
@@ -212,10 +311,22 @@ def process_directory(input_dir, output_dir, label, device='cpu'):
         Label for all persons in this directory (0 for normal, 1 for dementia)
     device : str
         Device to use for processing ('cpu' or 'cuda:0')
+    batch_size : int
+        Number of files passed through the MFCC extractor at once
+    force : bool
+        Reconvert files whose MFCC output is already up to date
+    convert : bool
+        If False, only pick up existing MFCC files from output_dir (nothing is
+        converted; audio paths are None)
+    workers : int, optional
+        Number of worker processes for CPU conversion (default: one per CPU core)
+    fp16 : bool
+        Store the features as float16, halving their size on disk (the
+        training loaders cast them back to float32)
     
     Returns:
     --------
-    dict: {person_name: [(audio_path, mfcc_path), ...]}
+    dict: {person_name: PersonFiles}
     """
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
@@ -225,6 +336,16 @@ def process_directory(input_dir, output_dir, label, device='cpu'):
     print(f"Label: {label} ({'Normal' if label == 0 else 'Dementia'})")
     print(f"{'='*60}")
     
+    if not convert:
+        # Existing MFCC files only: persons are the top-level folders of the
+        # input directory, no need to walk the audio tree
+        with os.scandir(input_dir) as entries:
+            person_names = [entry.name for entry in entries if entry.is_dir()]
+        person_mfcc = find_mfcc_by_person(output_dir, person_names)
+        print(f"Found existing MFCC files for {len(person_mfcc)} persons")
+        return {person_name: PersonFiles([None] * len(mfcc_files), mfcc_files)
+                for person_name, mfcc_files in person_mfcc.items()}
+    
     # Find all audio files grouped by person
     person_files = find_audio_files_by_person(input_dir)
     
@@ -234,25 +355,74 @@ def process_directory(input_dir, output_dir, label, device='cpu'):
     
     print(f"Found {len(person_files)} persons with audio files")
     
-    # Convert all audio files to MFCC
-    person_data = defaultdict(list)
-    total_files = sum(len(files) for files in person_files.values())
-    processed = 0
+    # Output path for every file: output_dir/person_name/filename.npy
+    # (one global sort by audio path, which also orders each person's files)
+    tasks = sorted(
+        ((person_name, audio_file, str(output_dir / person_name / f"{Path(audio_file).stem}.npy"))
+         for person_name, audio_files in person_files.items()
+         for audio_file in audio_files),
+        key=lambda task: task[1]
+    )
     
-    for person_name, audio_files in person_files.items():
-        print(f"\n[{processed+1}/{total_files}] Processing {person_name} ({len(audio_files)} files)...")
-        
-        for audio_file in sorted(audio_files):
-            processed += 1
-            print(f"   Converting: {audio_file.name}...", end=' ', flush=True)
-            
-            mfcc_file = convert_audio_to_mfcc(audio_file, output_dir, person_name, device=device)
-            person_data[person_name].append((audio_file, mfcc_file))
-            
-            if mfcc_file:
-                print("✅")
-            else:
-                print("❌")
+    # Files whose .npy was built from the current audio with the current
+    # MFCC settings are reused
+    if force:
+        todo = list(range(len(tasks)))
+    else:
+        todo = [i for i, (_, audio_file, output_file) in enumerate(tasks)
+                if not is_mfcc_cached(audio_file, output_file, device, fp16)]
+    print(f"Converting {len(todo)} files ({len(tasks) - len(todo)} up to date)...")
+    
+    # Group files of similar size so each extractor batch needs little
+    # padding; batches are independent and CPU-bound, so they run in
+    # parallel processes (GPU extraction stays in this process)
+    todo.sort(key=lambda i: os.path.getsize(tasks[i][1]))
+    batches = [todo[k:k + batch_size] for k in range(0, len(todo), batch_size)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if device != 'cpu':
+        workers = 1
+    workers = max(1, min(workers, len(batches)))
+    
+    audio_batches = [[tasks[i][1] for i in batch] for batch in batches]
+    output_batches = [[tasks[i][2] for i in batch] for batch in batches]
+    batch_results = [None] * len(batches)
+    # One progress bar in this process, advanced as batches complete
+    with tqdm(total=len(todo), desc='MFCC', unit='file', smoothing=0.1, ascii=True) as pbar:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(device,)) as executor:
+                futures = {
+                    executor.submit(audio_to_mfcc_batch, audio_batch, output_batch,
+                                    device, batch_size, fp16, loader_threads=1): k
+                    for k, (audio_batch, output_batch) in enumerate(zip(audio_batches, output_batches))
+                }
+                for future in as_completed(futures):
+                    k = futures[future]
+                    batch_results[k] = future.result()
+                    pbar.update(len(batch_results[k]))
+        else:
+            for k, (audio_batch, output_batch) in enumerate(zip(audio_batches, output_batches)):
+                batch_results[k] = audio_to_mfcc_batch(audio_batch, output_batch, device=device,
+                                                       batch_size=batch_size, fp16=fp16)
+                pbar.update(len(batch_results[k]))
+    converted = [mfcc_file for batch in batch_results for mfcc_file in batch]
+    
+    mfcc_files = [output_file for _, _, output_file in tasks]
+    for i, mfcc_file in zip(todo, converted):
+        mfcc_files[i] = mfcc_file
+        if mfcc_file:
+            write_mfcc_cache_meta(tasks[i][1], mfcc_file, device, fp16)
+    
+    # Report failures individually and everything else as one summary line
+    person_data = defaultdict(PersonFiles)
+    failed = []
+    for (person_name, audio_file, _), mfcc_file in zip(tasks, mfcc_files):
+        person_data[person_name].append(audio_file, mfcc_file)
+        if not mfcc_file:
+            failed.append(f"   ❌ {person_name}/{os.path.basename(audio_file)}\n")
+    sys.stdout.write(''.join(failed))
+    print(f"✅ {len(tasks) - len(failed)}/{len(tasks)} files have MFCC features")
     
     return person_data
 
@@ -291,8 +461,16 @@ def main():
                        help='Output CSV file path (default: data/csv_files/dataset.csv)')
     parser.add_argument('--device', default='cpu',
                        help='Device to use: "cpu" or "cuda:0" (default: cpu)')
+    parser.add_argument('--batch-size', type=int, default=32,
+                       help='Files per MFCC extractor call (default: 32)')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Worker processes for CPU conversion (default: number of CPU cores)')
+    parser.add_argument('--fp16', action='store_true',
+                       help='Save MFCC features as float16 (half the disk space)')
     parser.add_argument('--skip-conversion', action='store_true',
                        help='Skip audio conversion (use existing MFCC files)')
+    parser.add_argument('--force', action='store_true',
+                       help='Reconvert all files, even those with up-to-date MFCC files')
     
     args = parser.parse_args()
     
@@ -320,22 +498,20 @@ def main():
     print(f"CSV output: {csv_output}")
     print("="*60)
     
-    # Process dementia cases (label = 1)
     if args.skip_conversion:
         print("\n⚠️  Skipping audio conversion (using existing MFCC files)")
-        # Load existing person data structure
-        dementia_data = find_audio_files_by_person(dementia_dir)
-        # Convert to expected format (would need to find existing .npy files)
-        print("   Note: Skip conversion mode requires existing MFCC files")
-    else:
-        dementia_data = process_directory(dementia_dir, output_dir, label=1, device=args.device)
+    
+    # Process dementia cases (label = 1)
+    dementia_data = process_directory(dementia_dir, output_dir, label=1, device=args.device,
+                                      batch_size=args.batch_size, force=args.force,
+                                      convert=not args.skip_conversion, workers=args.workers,
+                                      fp16=args.fp16)
     
     # Process normal cases (label = 0)
-    if args.skip_conversion:
-        normal_data = find_audio_files_by_person(normal_dir)
-        print("   Note: Skip conversion mode requires existing MFCC files")
-    else:
-        normal_data = process_directory(normal_dir, output_dir, label=0, device=args.device)
+    normal_data = process_directory(normal_dir, output_dir, label=0, device=args.device,
+                                    batch_size=args.batch_size, force=args.force,
+                                    convert=not args.skip_conversion, workers=args.workers,
+                                    fp16=args.fp16)
     
     # Combine both datasets
     print(f"\n{'='*60}")
@@ -12,6 +12,11 @@ Usage:
 import sys
 import os
 import argparse
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
 
 # Try to import audio libraries
@@ -28,8 +33,44 @@ try:
 except ImportError:
     HAS_SOUNDFILE = False
 
+try:
+    import soxr  # installed with librosa, which uses it for resampling
+    HAS_SOXR = True
+except ImportError:
+    HAS_SOXR = False
+
 from azrt2021.mfcc import MFCC_Extractor
 
+# Formats libsndfile reads natively
+SOUNDFILE_EXTENSIONS = {'.wav', '.flac', '.ogg'}
+
+# Frames decoded per block when resampling while reading
+RESAMPLE_BLOCK_SIZE = 1 << 18
+
+
+def _read_resampled(audio_path, info, sr):
+    """
+    Decode audio block by block, mixing down to mono and resampling each
+    block with a streaming soxr resampler into a preallocated output.
+    
+    Peak memory stays at one block plus the output, instead of the whole
+    decoded file plus its resampled copy. Uses the same resampler and output
+    length as librosa.load(sr=sr, mono=True), so the samples match it.
+    """
+    out = np.zeros(int(np.ceil(info.frames * sr / info.samplerate)), dtype=np.float32)
+    resampler = soxr.ResampleStream(info.samplerate, sr, 1, dtype='float32', quality='HQ')
+    pos = 0
+    blocks = sf.blocks(audio_path, blocksize=RESAMPLE_BLOCK_SIZE, dtype='float32', always_2d=True)
+    for block in blocks:
+        chunk = resampler.resample_chunk(block.mean(axis=1), last=False)
+        n = min(len(chunk), len(out) - pos)
+        out[pos:pos + n] = chunk[:n]
+        pos += n
+    chunk = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+    n = min(len(chunk), len(out) - pos)
+    out[pos:pos + n] = chunk[:n]
+    return out
+
 
 def load_audio_file(audio_path, sr=16000):
     """
@@ -37,8 +78,9 @@ def load_audio_file(audio_path, sr=16000):
     
     Parameters:
     -----------
-    audio_path : str
-        Path to audio file (MP3, WAV, etc.)
+    audio_path : str or file-like
+        Path to audio file (MP3, WAV, etc.), or a binary file-like object
+        (e.g. io.BytesIO) holding a format libsndfile can decode
     sr : int
         Sample rate (default: 16000 Hz)
     
@@ -47,9 +89,32 @@ def load_audio_file(audio_path, sr=16000):
     audio : numpy.ndarray
         Audio signal as 1D array
     """
-    if not os.path.isfile(audio_path):
+    is_file_obj = hasattr(audio_path, 'read')
+    if not is_file_obj and not os.path.isfile(audio_path):
         raise FileNotFoundError(f"Audio file not found: {audio_path}")
     
+    # Formats libsndfile reads natively: probe the header, then read directly
+    # when already at the target rate (no resampling needed) or otherwise
+    # stream-resample while decoding
+    if HAS_SOUNDFILE and (is_file_obj or os.path.splitext(audio_path)[1].lower() in SOUNDFILE_EXTENSIONS):
+        try:
+            info = sf.info(audio_path)
+            if is_file_obj:
+                audio_path.seek(0)
+            if info.samplerate == sr:
+                audio, _ = sf.read(audio_path, dtype='float32', always_2d=False)
+                if audio.ndim > 1:
+                    audio = np.mean(audio, axis=1)  # Convert to mono
+                return audio
+            if HAS_SOXR:
+                return _read_resampled(audio_path, info, sr)
+        except RuntimeError:
+            # Unsupported or malformed for libsndfile (sf.LibsndfileError is a
+            # RuntimeError); anything else is a real error and propagates
+            pass
+        if is_file_obj:
+            audio_path.seek(0)
+    
     # Try librosa first (supports many formats)
     if HAS_LIBROSA:
         try:
@@ -61,6 +126,8 @@ def load_audio_file(audio_path, sr=16000):
     # Fallback to soundfile
     if HAS_SOUNDFILE:
         try:
+            if is_file_obj:
+                audio_path.seek(0)
             audio, sr_loaded = sf.read(audio_path)
             if len(audio.shape) > 1:
                 audio = np.mean(audio, axis=1)  # Convert to mono
@@ -77,7 +144,26 @@ def load_audio_file(audio_path, sr=16000):
     raise RuntimeError("Could not load audio file. Install librosa: pip install librosa")
 
 
-def audio_to_mfcc(audio_path, output_path, device='cpu', **mfcc_kwargs):
+@lru_cache(maxsize=None)
+def get_mfcc_extractor(device='cpu', **mfcc_kwargs):
+    """
+    Return a shared MFCC extractor with the parameters the model expects.
+    
+    The filter bank and DCT tables only depend on the configuration, so one
+    extractor per (device, kwargs) is built and reused for every file.
+    """
+    return MFCC_Extractor(
+        samplerate=16000,
+        winlen=0.025,      # 25ms window
+        winstep=0.01,      # 10ms step
+        numcep=13,         # 13 cepstral coefficients
+        nfilt=26,
+        device=device,
+        **mfcc_kwargs
+    )
+
+
+def audio_to_mfcc(audio_path, output_path, device='cpu', fp16=False, **mfcc_kwargs):
     """
     Convert audio file to MFCC features and save as .npy file.
     
@@ -86,9 +172,12 @@ def audio_to_mfcc(audio_path, output_path, device='cpu', **mfcc_kwargs):
     audio_path : str
         Path to input audio file
     output_path : str
-        Path to output .npy file
+        Path to output .npy file (its directory must already exist)
     device : str
         'cpu' or GPU device index (default: 'cpu')
+    fp16 : bool
+        Store the features as float16, halving file size (loaders cast back
+        to float32)
     **mfcc_kwargs : dict
         Additional arguments for MFCC_Extractor
     """
@@ -97,16 +186,8 @@ def audio_to_mfcc(audio_path, output_path, device='cpu', **mfcc_kwargs):
     
     print(f"Audio length: {len(audio) / 16000:.2f} seconds")
     
-    # Initialize MFCC extractor with default parameters matching the model
-    mfcc_extractor = MFCC_Extractor(
-        samplerate=16000,
-        winlen=0.025,      # 25ms window
-        winstep=0.01,      # 10ms step
-        numcep=13,         # 13 cepstral coefficients
-        nfilt=26,
-        device=device,
-        **mfcc_kwargs
-    )
+    # MFCC extractor with default parameters matching the model
+    mfcc_extractor = get_mfcc_extractor(device, **mfcc_kwargs)
     
     print("Extracting MFCC features...")
     # Reshape audio to (1, audio_length) for batch processing
@@ -115,19 +196,147 @@ def audio_to_mfcc(audio_path, output_path, device='cpu', **mfcc_kwargs):
     
     # Remove batch dimension: (1, num_windows, 13) -> (num_windows, 13)
     mfcc_features = mfcc_features[0]
+    if not isinstance(mfcc_features, np.ndarray):
+        mfcc_features = mfcc_features.get()  # cupy array on GPU -> host
     
     print(f"MFCC shape: {mfcc_features.shape}")
     print(f"Saving to: {output_path}")
     
-    # Create output directory if it doesn't exist
-    os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else '.', exist_ok=True)
-    
-    # Save as .npy file
-    np.save(output_path, mfcc_features)
+    # Save as .npy file (the output directory must exist)
+    if fp16:
+        mfcc_features = mfcc_features.astype(np.float16)
+    np.save(output_path, mfcc_features, allow_pickle=False)
     print(f"✓ Successfully saved MFCC features to {output_path}")
 
 
-def batch_process(input_dir, output_dir, device='cpu', **mfcc_kwargs):
+def audio_to_mfcc_batch(audio_paths, output_paths, device='cpu', batch_size=32, fp16=False, loader_threads=None,
+                        **mfcc_kwargs):
+    """
+    Convert many audio files to MFCC .npy files, batching extractor calls.
+    
+    Files are grouped by size into batches of similar lengths. A background
+    thread decodes each batch concurrently (libsndfile/librosa release the
+    GIL) and zero-pads it to its longest clip, handing at most two batches
+    ahead through a bounded queue; meanwhile this thread runs the extractor
+    on the previous batch, so decoding overlaps extraction (notably on GPU)
+    and only a few batches of audio are held in memory. Every file keeps
+    only the frames that lie entirely within its own samples, so the
+    features are identical to audio_to_mfcc.
+    
+    Parameters:
+    -----------
+    audio_paths : list of str
+        Paths to input audio files
+    output_paths : list of str
+        Paths to output .npy files, one per input
+    device : str
+        'cpu' or GPU device index (default: 'cpu')
+    batch_size : int
+        Number of files per extractor call
+    fp16 : bool
+        Store the features as float16
+    loader_threads : int, optional
+        Threads decoding each batch (default: min(8, CPU count)). Pass 1
+        when calling from a process pool that already uses every core
+    **mfcc_kwargs : dict
+        Additional arguments for MFCC_Extractor
+    
+    Returns:
+    --------
+    list : output path for each input, or None where conversion failed
+    """
+    mfcc_extractor = get_mfcc_extractor(device, **mfcc_kwargs)
+    winlen, winstep = mfcc_extractor.winlen, mfcc_extractor.winstep
+    
+    def file_size(i):
+        try:
+            return os.path.getsize(audio_paths[i])
+        except OSError:
+            return 0
+    
+    # Similar sizes in the same batch keep the zero padding small
+    order = sorted(range(len(audio_paths)), key=file_size)
+    batches = [order[k:k + batch_size] for k in range(0, len(order), batch_size)]
+    
+    def load(i):
+        try:
+            audio = load_audio_file(audio_paths[i])
+        except Exception as e:
+            print(f"Error loading {audio_paths[i]}: {e}")
+            return None
+        if len(audio) < winlen:
+            print(f"Error processing {audio_paths[i]}: audio shorter than one MFCC window")
+            return None
+        return audio
+    
+    loader_threads = loader_threads or min(8, os.cpu_count() or 1)
+    
+    def produce(batch_queue, stop):
+        try:
+            with ThreadPoolExecutor(max_workers=loader_threads) if loader_threads > 1 else nullcontext() as executor:
+                load_all = executor.map if executor is not None else map
+                for batch in batches:
+                    if stop.is_set():
+                        break
+                    loaded = [(i, audio) for i, audio in zip(batch, load_all(load, batch))
+                              if audio is not None]
+                    if not loaded:
+                        continue
+                    lengths = [len(audio) for _, audio in loaded]
+                    audio_batch = np.zeros((len(loaded), max(lengths)), dtype=np.float32)
+                    for row, (_, audio) in enumerate(loaded):
+                        audio_batch[row, :len(audio)] = audio
+                    batch_queue.put(([i for i, _ in loaded], audio_batch, lengths))
+        finally:
+            batch_queue.put(None)
+    
+    # Create each output directory once up front, not per file
+    for output_dir in {os.path.dirname(output_path) for output_path in output_paths}:
+        os.makedirs(output_dir or '.', exist_ok=True)
+    
+    results = [None] * len(audio_paths)
+    batch_queue = queue.Queue(maxsize=2)
+    stop = threading.Event()
+    producer = threading.Thread(target=produce, args=(batch_queue, stop), daemon=True)
+    producer.start()
+    
+    try:
+        while (item := batch_queue.get()) is not None:
+            bucket, audio_batch, lengths = item
+            try:
+                mfcc_batch = mfcc_extractor(audio_batch)
+                if not isinstance(mfcc_batch, np.ndarray):
+                    mfcc_batch = mfcc_batch.get()  # cupy array on GPU -> host
+            except Exception as e:
+                print(f"Error extracting MFCC features for batch: {e}")
+                continue
+            
+            for row, (i, length) in enumerate(zip(bucket, lengths)):
+                n_frames = (length - winlen) // winstep + 1
+                mfcc_features = mfcc_batch[row, :n_frames]
+                if fp16:
+                    mfcc_features = mfcc_features.astype(np.float16)
+                output_path = output_paths[i]
+                try:
+                    np.save(output_path, mfcc_features, allow_pickle=False)
+                except Exception as e:
+                    print(f"Error saving {output_path}: {e}")
+                    continue
+                results[i] = output_path
+    finally:
+        # If we stop early (e.g. interrupted), unblock the producer if it is
+        # waiting on the full queue so it can see the stop flag and exit
+        stop.set()
+        while producer.is_alive():
+            try:
+                batch_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        producer.join()
+    return results
+
+
+def batch_process(input_dir, output_dir, device='cpu', fp16=False, **mfcc_kwargs):
     """
     Process all audio files in a directory.
     
@@ -139,35 +348,35 @@ def batch_process(input_dir, output_dir, device='cpu', **mfcc_kwargs):
         Directory to save .npy files
     device : str
         'cpu' or GPU device index
+    fp16 : bool
+        Store the features as float16
     **mfcc_kwargs : dict
         Additional arguments for MFCC_Extractor
     """
-    audio_extensions = ['.mp3', '.wav', '.flac', '.m4a', '.ogg']
+    audio_extensions = frozenset({'.mp3', '.wav', '.flac', '.m4a', '.ogg'})
     
     if not os.path.isdir(input_dir):
         raise NotADirectoryError(f"Input directory not found: {input_dir}")
     
     os.makedirs(output_dir, exist_ok=True)
     
-    audio_files = []
-    for ext in audio_extensions:
-        audio_files.extend([f for f in os.listdir(input_dir) if f.lower().endswith(ext)])
+    # One directory scan, testing each name's extension against the set
+    with os.scandir(input_dir) as entries:
+        audio_files = sorted(entry.name for entry in entries
+                             if os.path.splitext(entry.name)[1].lower() in audio_extensions
+                             and entry.is_file())
     
     print(f"Found {len(audio_files)} audio files in {input_dir}")
     
-    for audio_file in audio_files:
-        input_path = os.path.join(input_dir, audio_file)
-        # Change extension to .npy
-        output_file = os.path.splitext(audio_file)[0] + '.npy'
-        output_path = os.path.join(output_dir, output_file)
-        
-        try:
-            audio_to_mfcc(input_path, output_path, device=device, **mfcc_kwargs)
-        except Exception as e:
-            print(f"Error processing {audio_file}: {e}")
-            continue
+    input_paths = [os.path.join(input_dir, audio_file) for audio_file in audio_files]
+    # Change extension to .npy
+    output_paths = [os.path.join(output_dir, os.path.splitext(audio_file)[0] + '.npy')
+                    for audio_file in audio_files]
+    
+    results = audio_to_mfcc_batch(input_paths, output_paths, device=device, fp16=fp16, **mfcc_kwargs)
+    processed = sum(result is not None for result in results)
     
-    print(f"\n✓ Batch processing complete. Processed {len(audio_files)} files.")
+    print(f"\n✓ Batch processing complete. Processed {processed}/{len(audio_files)} files.")
 
 
 def main():
@@ -180,6 +389,8 @@ def main():
                        help='Batch process all audio files in input directory')
     parser.add_argument('--device', default='cpu', 
                        help='Device to use: "cpu" or GPU index (default: cpu)')
+    parser.add_argument('--fp16', action='store_true',
+                       help='Save MFCC features as float16 (half the disk space)')
     
     args = parser.parse_args()
     
@@ -188,9 +399,10 @@ def main():
         sys.exit(1)
     
     if args.batch:
-        batch_process(args.input, args.output, device=args.device)
+        batch_process(args.input, args.output, device=args.device, fp16=args.fp16)
     else:
-        audio_to_mfcc(args.input, args.output, device=args.device)
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        audio_to_mfcc(args.input, args.output, device=args.device, fp16=args.fp16)
 
 
 if __name__ == '__main__':
@@ -5,7 +5,10 @@ Handles all common deployment issues and provides detailed diagnostics.
 """
 import os
 import sys
-import traceback
+
+# Read once at startup; treated as immutable for the life of the process
+PORT = int(os.environ.get("PORT", 8000))
+STARTUP_DIAG = bool(os.environ.get('STARTUP_DIAG'))
 
 def setup_environment():
     """Set up Python environment for deployment."""
@@ -19,29 +22,25 @@ def setup_environment():
     # Render deploys to /opt/render/project/src/voice_model/
     # We want to keep /opt/render/project/src/voice_model/ but remove /opt/render/project/src/
     # This prevents Python from trying to import 'src' as a module
-    filtered_path = []
-    for p in sys.path:
-        # Keep the current directory (voice_model) even if it contains 'src' in the path
-        if p == current_dir:
-            filtered_path.append(p)
-        # Keep paths that don't contain 'src'
-        elif 'src' not in p:
-            filtered_path.append(p)
-        # Remove paths that end with 'src' or have 'src' as a parent directory
-        # (these would cause Python to try to import 'src' as a module)
-        elif not p.endswith('src') and not p.endswith('src/'):
-            # Only keep if it's a subdirectory of our current_dir
-            if current_dir in p or p in current_dir:
-                filtered_path.append(p)
-    sys.path = filtered_path
+    src_suffixes = ('src', 'src/')
+    sys.path = [
+        p for p in sys.path
+        # Keep the current directory (voice_model) even if it contains 'src' in the path,
+        # and paths that don't contain 'src'
+        if p == current_dir or 'src' not in p
+        # Remove paths that end with 'src' (these would cause Python to try to import
+        # 'src' as a module); otherwise only keep subdirectories of current_dir
+        or (not p.endswith(src_suffixes) and (current_dir in p or p in current_dir))
+    ]
     
     # Add current directory to Python path (MUST be first and ONLY the voice_model dir)
-    if current_dir not in sys.path:
+    path_set = set(sys.path)
+    if current_dir not in path_set:
         sys.path.insert(0, current_dir)
     
     # Add azrt2021 subdirectory to path
     azrt2021_dir = os.path.join(current_dir, 'azrt2021')
-    if azrt2021_dir not in sys.path and os.path.exists(azrt2021_dir):
+    if azrt2021_dir not in path_set and os.path.exists(azrt2021_dir):
         sys.path.insert(0, azrt2021_dir)
     
     # IMPORTANT: Do NOT add parent directory - it contains 'src' which causes import errors
@@ -49,24 +48,6 @@ def setup_environment():
     
     return current_dir
 
-def verify_files(current_dir):
-    """Verify all required files exist."""
-    required_files = ['api.py', 'requirements.txt']
-    missing_files = []
-    
-    for file in required_files:
-        file_path = os.path.join(current_dir, file)
-        if not os.path.exists(file_path):
-            missing_files.append(file)
-    
-    if missing_files:
-        print(f"❌ ERROR: Missing required files: {', '.join(missing_files)}")
-        print(f"Current directory: {current_dir}")
-        print(f"Files present: {os.listdir(current_dir)}")
-        return False
-    
-    return True
-
 def print_diagnostics(current_dir):
     """Print diagnostic information for troubleshooting."""
     print("=" * 70)
@@ -115,73 +96,21 @@ def print_diagnostics(current_dir):
     print("=" * 70)
     print()
 
-def test_imports():
-    """Test if we can import the api module."""
-    print("Testing imports...")
-    try:
-        # Test basic imports first
-        import tempfile
-        from pathlib import Path
-        print("✅ Standard library imports OK")
-        
-        # Test third-party imports
-        try:
-            import numpy
-            import torch
-            print("✅ NumPy and PyTorch imports OK")
-        except ImportError as e:
-            print(f"⚠️  Warning: {e}")
-            print("   This might cause issues later")
-        
-        # Test FastAPI
-        try:
-            import fastapi
-            import uvicorn
-            print("✅ FastAPI and Uvicorn imports OK")
-        except ImportError as e:
-            print(f"❌ ERROR: {e}")
-            return False
-        
-        # Test our custom modules
-        try:
-            import api
-            print("✅ api module imported successfully")
-            if hasattr(api, 'app'):
-                print("✅ api.app found")
-                return True
-            else:
-                print("❌ api.app not found")
-                return False
-        except ImportError as e:
-            print(f"❌ ERROR importing api module: {e}")
-            print(f"   Traceback:")
-            traceback.print_exc()
-            return False
-            
-    except Exception as e:
-        print(f"❌ ERROR during import test: {e}")
-        traceback.print_exc()
-        return False
-
 def main():
     """Main entry point."""
     try:
         # Setup environment
         current_dir = setup_environment()
         
-        # Print diagnostics
-        print_diagnostics(current_dir)
-        
-        # Verify files exist
-        if not verify_files(current_dir):
-            sys.exit(1)
-        
-        # Test imports
-        if not test_imports():
-            print("\n❌ Import tests failed. Check the errors above.")
-            sys.exit(1)
+        # Print diagnostics (opt-in: STARTUP_DIAG=1, or `python run.py --diagnose`
+        # to print them and exit without starting the server)
+        diagnose_only = '--diagnose' in sys.argv[1:]
+        if STARTUP_DIAG or diagnose_only:
+            print_diagnostics(current_dir)
+        if diagnose_only:
+            return
         
-        # Import the app
+        # Import the app (the import itself reports missing files and dependencies)
         print("\nImporting application...")
         try:
             import api
@@ -189,22 +118,23 @@ def main():
             print("✅ Application imported successfully")
         except Exception as e:
             print(f"❌ FATAL: Failed to import application: {e}")
+            import traceback
             traceback.print_exc()
             sys.exit(1)
         
         # Start the server
         import uvicorn
-        port = int(os.environ.get("PORT", 8000))
         
         print("\n" + "=" * 70)
-        print(f"🚀 Starting server on port {port}...")
+        print(f"🚀 Starting server on port {PORT}...")
         print("=" * 70 + "\n")
         
         uvicorn.run(
             app,
             host="0.0.0.0",
-            port=port,
-            log_level="info"
+            port=PORT,
+            log_level="info",
+            **api.SERVER_OPTIONS
         )
         
     except KeyboardInterrupt:
@@ -212,6 +142,7 @@ def main():
         sys.exit(0)
     except Exception as e:
         print(f"\n❌ FATAL ERROR: {e}")
+        import traceback
         traceback.print_exc()
         sys.exit(1)
 
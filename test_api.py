@@ -7,9 +7,55 @@ Usage:
     python test_api.py audio.mp3
 """
 
+import os
 import sys
-import requests
 import json
+import uuid
+import http.client
+from urllib.parse import urlsplit
+
+
+def open_connection(api_url):
+    """
+    Open one keep-alive connection to the API; returns (connection, base path).
+    """
+    parts = urlsplit(api_url)
+    conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    return conn_cls(parts.netloc), parts.path.rstrip("/")
+
+
+def get_json(conn, path):
+    """
+    GET path on conn and decode the JSON response.
+    """
+    conn.request("GET", path)
+    return json.loads(conn.getresponse().read())
+
+
+def post_file(conn, path, audio_file, chunk_size=1 << 16):
+    """
+    POST a file as multipart/form-data field "file"; returns (status, body).
+    The file is streamed from disk in chunk_size pieces rather than read whole.
+    """
+    boundary = uuid.uuid4().hex
+    filename = os.path.basename(audio_file)
+    prologue = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+                f'filename="{filename}"\r\n\r\n').encode()
+    epilogue = f'\r\n--{boundary}--\r\n'.encode()
+    with open(audio_file, "rb") as f:
+        length = len(prologue) + os.fstat(f.fileno()).st_size + len(epilogue)
+        
+        def body():
+            yield prologue
+            yield from iter(lambda: f.read(chunk_size), b"")
+            yield epilogue
+        
+        conn.request("POST", path, body=body(),
+                     headers={"Content-Type": f"multipart/form-data; boundary={boundary}",
+                              "Content-Length": str(length)})
+    response = conn.getresponse()
+    return response.status, response.read().decode()
+
 
 def test_api(audio_file, api_url="http://localhost:8000"):
     """
@@ -29,62 +75,64 @@ def test_api(audio_file, api_url="http://localhost:8000"):
     print(f"Audio file: {audio_file}")
     print()
     
-    # Check health
+    # Both requests share one connection (one TCP/TLS handshake)
+    conn, base_path = open_connection(api_url)
     try:
-        health_response = requests.get(f"{api_url}/health")
-        health_data = health_response.json()
-        print(f"✅ API Health: {health_data['status']}")
-        print(f"   Model loaded: {health_data['model_loaded']}")
-        print(f"   Device: {health_data['device']}")
-        print()
-    except Exception as e:
-        print(f"❌ Error connecting to API: {e}")
-        print(f"   Make sure the API is running: uvicorn api:app --host 0.0.0.0 --port 8000")
-        return
+        # Check health
+        try:
+            health_data = get_json(conn, f"{base_path}/health")
+            print(f"✅ API Health: {health_data['status']}")
+            print(f"   Model loaded: {health_data['model_loaded']}")
+            print(f"   Device: {health_data['device']}")
+            print()
+        except Exception as e:
+            print(f"❌ Error connecting to API: {e}")
+            print(f"   Make sure the API is running: uvicorn api:app --host 0.0.0.0 --port 8000")
+            return
     
-    # Upload and analyze file
-    try:
-        print("📤 Uploading file...")
-        with open(audio_file, "rb") as f:
-            files = {"file": f}
-            response = requests.post(f"{api_url}/predict", files=files)
+        # Upload and analyze file
+        try:
+            print("📤 Uploading file...")
+            status, text = post_file(conn, f"{base_path}/predict", audio_file)
         
-        if response.status_code == 200:
-            result = response.json()
+            if status == 200:
+                result = json.loads(text)
             
-            print("✅ Analysis complete!")
-            print()
-            print("=" * 60)
-            print("RESULTS")
-            print("=" * 60)
-            print(f"Result: {result['result'].upper()}")
-            print(f"Confidence: {result['confidence']*100:.2f}%")
-            print()
-            print("Probabilities:")
-            print(f"  Normal:    {result['probabilities']['normal_percentage']:.2f}%")
-            print(f"  Dementia: {result['probabilities']['dementia_percentage']:.2f}%")
-            print()
-            print(f"Message: {result['message']}")
-            print()
-            print(f"Audio Info:")
-            print(f"  Length: {result['audio_info']['length_seconds']:.2f} seconds")
-            print(f"  MFCC Shape: {result['audio_info']['mfcc_features_shape']}")
-            print()
-            print(f"Note: {result['note']}")
-            print("=" * 60)
+                print("✅ Analysis complete!")
+                print()
+                print("=" * 60)
+                print("RESULTS")
+                print("=" * 60)
+                print(f"Result: {result['result'].upper()}")
+                print(f"Confidence: {result['confidence']*100:.2f}%")
+                print()
+                print("Probabilities:")
+                print(f"  Normal:    {result['probabilities']['normal_percentage']:.2f}%")
+                print(f"  Dementia: {result['probabilities']['dementia_percentage']:.2f}%")
+                print()
+                print(f"Message: {result['message']}")
+                print()
+                print(f"Audio Info:")
+                print(f"  Length: {result['audio_info']['length_seconds']:.2f} seconds")
+                print(f"  MFCC Shape: {result['audio_info']['mfcc_features_shape']}")
+                print()
+                print(f"Note: {result['note']}")
+                print("=" * 60)
             
-            # Pretty print full JSON
-            print("\nFull JSON Response:")
-            print(json.dumps(result, indent=2))
+                # Pretty print full JSON
+                print("\nFull JSON Response:")
+                print(json.dumps(result, indent=2))
             
-        else:
-            print(f"❌ Error: {response.status_code}")
-            print(f"   {response.text}")
+            else:
+                print(f"❌ Error: {status}")
+                print(f"   {text}")
     
-    except FileNotFoundError:
-        print(f"❌ Error: File not found: {audio_file}")
-    except Exception as e:
-        print(f"❌ Error: {e}")
+        except FileNotFoundError:
+            print(f"❌ Error: File not found: {audio_file}")
+        except Exception as e:
+            print(f"❌ Error: {e}")
+    finally:
+        conn.close()
 
 
 if __name__ == "__main__":
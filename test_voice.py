@@ -13,16 +13,42 @@ Example:
 import sys
 import os
 import argparse
-import numpy as np
-import torch
+from functools import lru_cache
 
 # Add azrt2021 to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'azrt2021'))
 
-from azrt2021.model import Model
-from azrt2021.tcn import TCN
-from preprocess_audio import audio_to_mfcc, load_audio_file
-from azrt2021.mfcc import MFCC_Extractor
+N_CONCAT = 10
+
+
+def iter_model_files(root):
+    """
+    Yield (path, mtime) for every non-tmp .pt file below root.
+    """
+    with os.scandir(root) as it:
+        for entry in it:
+            name = entry.name
+            if name.startswith('.'):
+                continue  # skip hidden files and directories (.ipynb_checkpoints, ...)
+            if not name.endswith('.pt'):
+                if entry.is_dir(follow_symlinks=False):
+                    yield from iter_model_files(entry.path)
+            elif 'tmp' not in name and entry.is_file():
+                yield entry.path, entry.stat().st_mtime
+
+
+@lru_cache(maxsize=4)
+def load_model(model_path, device='cpu'):
+    """
+    Load a trained model once per (model_path, device) and reuse it.
+    """
+    from azrt2021.model import Model
+    from azrt2021.tcn import TCN
+    neural_network = TCN(device)
+    model_obj = Model(n_concat=N_CONCAT, device=device, nn=neural_network)
+    model_obj.load_model(model_path)
+    model_obj.nn.eval()  # Set to evaluation mode
+    return model_obj
 
 
 def predict_voice(audio_path, model_path=None, device='cpu'):
@@ -51,89 +77,70 @@ def predict_voice(audio_path, model_path=None, device='cpu'):
     
     # Step 1: Convert audio to MFCC features
     print(f"\n[1/4] Loading and preprocessing audio: {audio_path}")
-    if not os.path.isfile(audio_path):
-        raise FileNotFoundError(f"Audio file not found: {audio_path}")
     
-    # Load audio
+    # Heavy ML imports are deferred until there is work to do, so that
+    # `--help` and argument errors return immediately
+    import torch
+    from preprocess_audio import get_mfcc_extractor, load_audio_file
+    
+    # Load audio (raises FileNotFoundError for a missing file)
     audio = load_audio_file(audio_path)
     print(f"   Audio length: {len(audio) / 16000:.2f} seconds")
     
-    # Extract MFCC features
-    mfcc_extractor = MFCC_Extractor(
-        samplerate=16000,
-        winlen=0.025,
-        winstep=0.01,
-        numcep=13,
-        nfilt=26,
-        device=device
-    )
+    # Extract MFCC features (shared extractor, built once per device)
+    mfcc_extractor = get_mfcc_extractor(device)
     
-    audio_batch = audio.reshape(1, -1)
-    mfcc_features = mfcc_extractor(audio_batch)[0]  # Remove batch dimension
-    print(f"   MFCC features shape: {mfcc_features.shape}")
+    # (1, n_samples) view in, (1, n_frames, 13) batch out; kept batched so
+    # reformat can take its rows directly
+    mfcc_batch = mfcc_extractor(audio[None, :])
+    print(f"   MFCC features shape: {mfcc_batch.shape[1:]}")
     
     # Step 2: Find model file if not provided
     if model_path is None:
         print(f"\n[2/4] Finding trained model...")
         # Look for the most recent model in pt_files directory
         pt_files_dir = os.path.join(os.path.dirname(__file__), 'azrt2021', 'pt_files')
-        if os.path.isdir(pt_files_dir):
-            # Find all .pt files
-            pt_files = []
-            for root, dirs, files in os.walk(pt_files_dir):
-                for file in files:
-                    if file.endswith('.pt') and 'tmp' not in file:
-                        pt_files.append(os.path.join(root, file))
-            
-            if pt_files:
-                # Sort by modification time, get most recent
-                pt_files.sort(key=os.path.getmtime, reverse=True)
-                model_path = pt_files[0]
-                print(f"   Using model: {os.path.basename(model_path)}")
-            else:
-                raise FileNotFoundError(
-                    f"No trained model found in {pt_files_dir}. "
-                    f"Please train a model first or specify model_path."
-                )
-        else:
+        try:
+            # Pick the most recently modified .pt file in one pass
+            model_path = max(iter_model_files(pt_files_dir), key=lambda x: x[1], default=(None, 0))[0]
+        except FileNotFoundError:
             raise FileNotFoundError(
                 f"Model directory not found: {pt_files_dir}. "
                 f"Please specify model_path."
+            ) from None
+        if model_path is None:
+            raise FileNotFoundError(
+                f"No trained model found in {pt_files_dir}. "
+                f"Please train a model first or specify model_path."
             )
+        print(f"   Using model: {os.path.basename(model_path)}")
     else:
         print(f"\n[2/4] Loading specified model: {model_path}")
-        if not os.path.isfile(model_path):
-            raise FileNotFoundError(f"Model file not found: {model_path}")
     
     # Step 3: Load model
     print(f"\n[3/4] Loading trained model...")
-    n_concat = 10
-    neural_network = TCN(device)
-    model_obj = Model(n_concat=n_concat, device=device, nn=neural_network)
-    model_obj.load_model(model_path)
-    model_obj.nn.eval()  # Set to evaluation mode
+    try:
+        model_obj = load_model(model_path, device)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Model file not found: {model_path}") from None
     print(f"   Model loaded successfully")
     
     # Step 4: Run inference
     print(f"\n[4/4] Running inference...")
     
-    # Prepare data in the format the model expects
-    # The model expects a list of numpy arrays (one per sample)
-    mfcc_list = [mfcc_features]
-    
-    # Reformat using the model's reformat function (this will pad to 16384 frames)
-    model_obj.nn.reformat(mfcc_list, n_concat)
+    # Reformat the batch rows into the model's packed input (pads to 16384 frames)
+    mfcc_list = model_obj.nn.reformat(list(mfcc_batch), N_CONCAT)
     
     # Get prediction
-    with torch.no_grad():
+    with torch.inference_mode():
         scores = model_obj.nn.get_scores(mfcc_list)
         # scores is a tensor of shape (1, 2) - [class_0_score, class_1_score]
-        # Convert to probability using softmax
-        probs = torch.softmax(scores, dim=1)
+        # Convert to probability using softmax (one host transfer for both values)
+        probs = torch.softmax(scores, dim=1)[0].tolist()
         # NOTE: Based on user feedback, the labels appear to be flipped
         # Flipping the interpretation: class 0 = Dementia, class 1 = Normal
-        dementia_prob = probs[0][0].item()    # Probability of class 0 (dementia - FLIPPED)
-        normal_prob = probs[0][1].item()      # Probability of class 1 (normal - FLIPPED)
+        dementia_prob = probs[0]    # Probability of class 0 (dementia - FLIPPED)
+        normal_prob = probs[1]      # Probability of class 1 (normal - FLIPPED)
     
     # Step 5: Display results
     print("\n" + "=" * 60)